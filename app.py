@@ -1,111 +1,256 @@
-from flask import Flask, render_template, request
-from utils.data_loader import load_data, load_fixed_genres
-from visualizations.genre_trends import genre_distribution, genre_evolution_by_year
-from visualizations.popularity_analysis import (
-    artist_vs_track_popularity,
-    popularity_distribution
-)
-from visualizations.duration_analysis import (
-    duration_distribution,
-    duration_by_genre
-)
-from visualizations.artist_analysis import (
-    most_frequent_artists,
-    artist_popularity_genre
-)
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+import plotly
+from flask import Flask, Response, g, render_template, request, send_from_directory, url_for
+from markupsafe import escape
+from utils import metrics
+from utils.caching import invalidate_frame
+from utils.dashboard import CHARTS, LAZY_CHARTS, build_chart, render_charts
+from utils.dataset import current_dataset, load_dataset, on_swap, on_warm, start_watcher
+from utils.page_cache import PageCache, negotiate_encoding, page_key, quantize_range
+from utils.profiling import PROFILE_SAMPLE_RATE, PROFILE_TOKEN, ProfilingMiddleware, bypass_caches
+from visualizations.plot_utils import RENDER_MODE
 
 app = Flask(__name__)
 
+# Opt-in request profiling, see utils/profiling.py
+if PROFILE_TOKEN or PROFILE_SAMPLE_RATE:
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
+
 print("Loading data...")
-df = load_data()
-fixed_genres_df = load_fixed_genres()
-
-print("Updating genres...")
-try:
-    missing_genres_mask = df['genres'].apply(lambda x: not x)
-    
-    if not fixed_genres_df.empty:
-        # Create a mapping from id to genres, keeping only the first occurrence of each id
-        genres_map = fixed_genres_df.drop_duplicates('id').set_index('id')['genres']
-        
-        # Update only the rows with missing genres using the mapping
-        updates = df.loc[missing_genres_mask, 'id'].map(genres_map)
-        df.loc[missing_genres_mask & updates.notna(), 'genres'] = updates[updates.notna()]
-        
-        #print(f"Updated {missing_genres_mask.sum()} tracks with missing genres")
-except Exception as e:
-    print(f"Warning: Error updating genres: {str(e)}")
-    print("Continuing with original genres...")
+load_dataset()
 
-@app.route('/')
-def index():
-    """Render the main dashboard page with all visualizations."""
+# plotly.js is served once from the installed plotly package under a versioned URL, so
+# browsers and CDNs can cache it for a year instead of receiving it inside every chart
+PLOTLY_JS_DIR = os.path.join(os.path.dirname(plotly.__file__), 'package_data')
+PLOTLY_JS_MAX_AGE = 365 * 24 * 60 * 60
+
+@app.route(f'/static/vendor/plotly-{plotly.__version__}.min.js')
+def plotly_js():
+    """Serve the plotly.js bundle shared by every chart on the page."""
+    response = send_from_directory(PLOTLY_JS_DIR, 'plotly.min.js', max_age=PLOTLY_JS_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _count_request(response):
+    started = g.pop('request_started', None)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = {'route': route, 'status': str(response.status_code)}
+    if 'page_cache' in g:
+        labels['page_cache'] = g.page_cache
+    metrics.inc('dashboard_requests_total', **labels)
+    if started is not None:
+        metrics.observe('dashboard_request_seconds', time.perf_counter() - started, route=route)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose this process's metrics to Prometheus."""
+    return Response(metrics.render(page_cache), mimetype='text/plain; version=0.0.4')
+
+@app.context_processor
+def inject_render_mode():
+    return {'render_mode': RENDER_MODE}
+
+# Chart API responses may be reused by browsers and CDNs for as long as the plot cache keeps them
+CHART_API_MAX_AGE = 300
+
+def _popularity_range():
+    # Get popularity filter settings from query parameters
+    popularity_min = float(request.args.get('popularity_min', 0))
+    popularity_max = float(request.args.get('popularity_max', 100))
+    # Infinite bounds are clamped to 0-100, but NaN has no place on the scale
+    if math.isnan(popularity_min) or math.isnan(popularity_max):
+        raise ValueError("popularity_min and popularity_max must not be NaN")
+    # Snapped before any rendering, so the page and its cache key always agree
+    return quantize_range((popularity_min, popularity_max))
+
+def _chart_shells(popularity_range):
+    """Empty chart containers that static/js/dashboard.js fills from the chart API."""
+    shells = {}
+    for name, chart in CHARTS.items():
+        # Unfiltered charts get one URL regardless of the sliders, so caches share it
+        params = {}
+        if chart.filtered:
+            params = {
+                'popularity_min': f"{popularity_range[0]:g}",
+                'popularity_max': f"{popularity_range[1]:g}"
+            }
+        src = escape(url_for('chart_api', name=name, **params))
+        for output in chart.outputs:
+            shells[output] = f'<div class="chart-shell loading" data-src="{src}" data-output="{output}"></div>'
+    return shells
+
+@app.route('/api/charts/<name>')
+def chart_api(name):
+    """Return the figure JSON of one chart, keyed by the template variable it fills."""
+    if name not in CHARTS:
+        return {'error': f"Unknown chart: {name}"}, 404
     try:
-        # Get popularity filter settings from query parameters
-        popularity_min = float(request.args.get('popularity_min', 0))
-        popularity_max = float(request.args.get('popularity_max', 100))
-        popularity_range = (popularity_min, popularity_max)
-        
-        visualizations = {}
-        visualizations['popularity_range'] = popularity_range
-        
-        try:
-            visualizations['genre_chart'] = genre_distribution(df, popularity_range)
-        except Exception as e:
-            print(f"Error generating genre distribution: {str(e)}")
-            visualizations['genre_chart'] = "<div class='error-message'>Error loading genre distribution</div>"
+        popularity_range = _popularity_range()
+    except ValueError:
+        return {'error': 'popularity_min and popularity_max must be numbers'}, 400
 
-       
-        try:
-            visualizations['pop_chart'] = artist_vs_track_popularity(df)
-        except Exception as e:
-            print(f"Error generating popularity chart: {str(e)}")
-            visualizations['pop_chart'] = "<div class='error-message'>Error loading popularity chart</div>"
-            
-        try:
-            visualizations['duration_chart'] = duration_distribution(df)
-        except Exception as e:
-            print(f"Error generating duration chart: {str(e)}")
-            visualizations['duration_chart'] = "<div class='error-message'>Error loading duration chart</div>"
-            
-        try:
-            visualizations['duration_by_genre'] = duration_by_genre(df, popularity_range)
-        except Exception as e:
-            print(f"Error generating duration by genre: {str(e)}")
-            visualizations['duration_by_genre'] = "<div class='error-message'>Error loading duration by genre chart</div>"
-            
-        try:
-            visualizations['genre_evolution'] = genre_evolution_by_year(df)
-        except Exception as e:
-            print(f"Error generating genre evolution: {str(e)}")
-            visualizations['genre_evolution'] = "<div class='error-message'>Error loading genre evolution</div>"
-            
-        try:
-            visualizations['artist_pop_dist'], visualizations['track_pop_dist'] = popularity_distribution(df)
-        except Exception as e:
-            print(f"Error generating popularity distributions: {str(e)}")
-            visualizations['artist_pop_dist'] = "<div class='error-message'>Error loading artist popularity distribution</div>"
-            visualizations['track_pop_dist'] = "<div class='error-message'>Error loading track popularity distribution</div>"
+    timings = {}
+    try:
+        specs = build_chart(name, current_dataset().frame, popularity_range, output='json', timings=timings)
+    except Exception as e:
+        print(f"Error generating {name}: {str(e)}")
+        return {'error': f"Error loading {name}"}, 500
 
+    # Specs are already JSON, so they are spliced in rather than parsed and re-encoded
+    body = '{' + ','.join(
+        f"{json.dumps(output)}:{spec}" for output, spec in zip(CHARTS[name].outputs, specs)
+    ) + '}'
+    response = Response(body, mimetype='application/json')
+    response.headers['Server-Timing'] = _chart_server_timing(timings)
+    response.cache_control.public = True
+    response.cache_control.max_age = CHART_API_MAX_AGE
+    return response
+
+page_cache = PageCache()
+
+def _chart_server_timing(timings, *extra):
+    # One entry per chart, e.g. chart-duration_by_genre;dur=84.2;desc="miss"
+    entries = [(f"chart-{name}", timing.wall, timing.cache or timing.outcome)
+               for name, timing in list(timings.items())]
+    return metrics.server_timing(entries + list(extra))
+
+def _page_response(body, etag, encoding, status=200):
+    response = Response(body, status=status, mimetype='text/html')
+    response.set_etag(etag)
+    # Browsers may keep the page but must revalidate it, which costs a 304 when unchanged
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity' and status == 200:
+        response.content_encoding = encoding
+    return response
+
+# Default range plus, optionally, every range on a grid of this spacing (e.g. 10)
+PAGE_PREWARM = os.getenv('PAGE_PREWARM', '1') == '1'
+PAGE_PREWARM_GRID = float(os.getenv('PAGE_PREWARM_GRID', 0))
+
+def _page_key(dataset, popularity_range, current_date):
+    # Everything the page depends on, so a matching ETag is answered before any chart work
+    return page_key(dataset.version, popularity_range, RENDER_MODE, LAZY_CHARTS, current_date)
+
+def _render_page(dataset, popularity_range, current_date, timings=None):
+    """Render the dashboard; returns (html, complete) where incomplete pages hold placeholders."""
+    complete = True
+    if LAZY_CHARTS:
+        visualizations = _chart_shells(popularity_range)
+    else:
+        visualizations, complete = render_charts(dataset.frame, popularity_range, timings)
+    visualizations['popularity_range'] = popularity_range
+    visualizations['current_date'] = current_date
+
+    return render_template('index.html', **visualizations), complete
+
+def _prewarm_ranges():
+    ranges = [(0, 100)]
+    if PAGE_PREWARM_GRID > 0:
+        steps = int(100 // PAGE_PREWARM_GRID)
+        points = [round(i * PAGE_PREWARM_GRID, 6) for i in range(steps + 1)]
+        ranges += [(low, high) for low in points for high in points if low < high]
+    return list(dict.fromkeys(quantize_range(r) for r in ranges))
+
+def prewarm_pages(dataset):
+    """
+    Render the common pages before the first request arrives.
+
+    Runs at import, so each worker fills its page cache (and the plot cache,
+    including the JSON specs used in lazy mode) before it starts serving, and
+    again for each reloaded dataset before it goes live.
+    """
+    current_date = datetime.now().strftime('%B %d, %Y')
+    ranges = _prewarm_ranges()
+    started = time.perf_counter()
+    for popularity_range in ranges:
         try:
-            visualizations['most_frequent_artists'] = most_frequent_artists(df)
-        except Exception as e:
-            print(f"Error generating most frequent artists: {str(e)}")
-            visualizations['most_frequent_artists'] = "<div class='error-message'>Error loading most frequent artists chart</div>"
-            
-        try:
-            visualizations['artist_popularity_genre'] = artist_popularity_genre(df)
+            with app.test_request_context('/'):
+                html, complete = _render_page(dataset, popularity_range, current_date)
+            if complete:
+                key = _page_key(dataset, popularity_range, current_date)
+                page_cache.put(key, html, encodings=('gzip', 'br'), tag=dataset.version)
+            else:
+                print(f"Warning: page for popularity {popularity_range} rendered incomplete")
+            if LAZY_CHARTS:
+                for name, chart in CHARTS.items():
+                    if chart.filtered or popularity_range == ranges[0]:
+                        build_chart(name, dataset.frame, popularity_range, output='json')
         except Exception as e:
-            print(f"Error generating artist popularity by genre: {str(e)}")
-            visualizations['artist_popularity_genre'] = "<div class='error-message'>Error loading artist popularity by genre chart</div>"
+            print(f"Warning: could not pre-render page for popularity {popularity_range}: {str(e)}")
+    print(f"Pre-rendered {len(ranges)} page(s) in {time.perf_counter() - started:.1f}s")
+
+@app.route('/')
+def index():
+    """Render the main dashboard page with all visualizations."""
+    try:
+        started = time.perf_counter()
+        dataset = current_dataset()
+        popularity_range = _popularity_range()
+        current_date = datetime.now().strftime('%B %d, %Y')
+        
+        key = _page_key(dataset, popularity_range, current_date)
+        encoding = negotiate_encoding(request.accept_encodings)
+        etag = f"{key}-{encoding}"
+        # Profiles of on-demand requests should show a full render
+        cached = not bypass_caches()
+        if cached and request.if_none_match.contains_weak(etag):
+            g.page_cache = 'not_modified'
+            response = _page_response(b'', etag, encoding, status=304)
+            response.headers['Server-Timing'] = metrics.server_timing([('page-cache', None, 'not-modified')])
+            return response
         
-        from datetime import datetime
-        visualizations['current_date'] = datetime.now().strftime('%B %d, %Y')
+        body = page_cache.get(key, encoding) if cached else None
+        if body is not None:
+            g.page_cache = 'hit'
+            response = _page_response(body, etag, encoding)
+            response.headers['Server-Timing'] = metrics.server_timing(
+                [('page-cache', time.perf_counter() - started, 'hit')]
+            )
+            return response
 
-        return render_template('index.html', **visualizations)
+        g.page_cache = 'miss'
+        timings = {}
+        html, complete = _render_page(dataset, popularity_range, current_date, timings)
+        render_seconds = time.perf_counter() - started
+        if not complete:
+            # Pages with placeholders must not be cached or validated
+            response = Response(html, mimetype='text/html')
+        else:
+            variants = page_cache.put(key, html, encodings=(encoding,), tag=dataset.version)
+            response = _page_response(variants[encoding], etag, encoding)
+        response.headers['Server-Timing'] = _chart_server_timing(
+            timings, ('render', render_seconds, None), ('total', time.perf_counter() - started, None)
+        )
+        return response
     except Exception as e:
         print(f"Error generating dashboard: {str(e)}")
         return render_template('error.html', error=str(e))
+
+@on_swap
+def _drop_previous_version(new, old):
+    pages = page_cache.invalidate(old.version)
+    plots = invalidate_frame(old.frame)
+    print(f"Dropped {pages} page(s) and {plots} plot(s) of dataset version {old.version}")
+
+if PAGE_PREWARM:
+    prewarm_pages(current_dataset())
+    on_warm(prewarm_pages)
+
+start_watcher()
+
 if __name__ == '__main__':
     from waitress import serve
     serve(app, host='0.0.0.0', port=8080)
\ No newline at end of file
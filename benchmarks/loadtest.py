@@ -0,0 +1,283 @@
+"""
+End-to-end load test of the dashboard under waitress or gunicorn.
+
+Boots the app on a synthetic dataset with the requested server settings,
+drives ``/`` with a mix of popularity filters at fixed concurrency levels, and
+reports throughput, latency percentiles and the resident memory of every
+server process:
+
+    python -m benchmarks.loadtest --server waitress --threads 8 --rows 50k --concurrency 1,8,32
+    python -m benchmarks.loadtest --server gunicorn --workers 4 --threads 2 --rows 50k --duration 30
+
+The client runs in this process, one thread per simulated user with a
+keep-alive connection; at high concurrency check that it is not the bottleneck
+(e.g. compare against a lighter page mix).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from benchmarks.synthetic import DEFAULT_DATA_DIR, parse_size, synthetic_path
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Filter mixes: the default page, slider positions people actually pick, or anything
+MIXES = ('default', 'realistic', 'uniform')
+
+def popularity_params(mix, rng):
+    """Return the query parameters of one request drawn from ``mix``."""
+    if mix == 'default':
+        return {}
+    if mix == 'realistic':
+        roll = rng.random()
+        if roll < 0.5:
+            return {}
+        if roll < 0.85:
+            # Round numbers, as left by dragging the sliders to a mark
+            low = rng.choice(range(0, 91, 10))
+            high = rng.choice(range(low + 10, 101, 10))
+            return {'popularity_min': low, 'popularity_max': high}
+    low = rng.randint(0, 99)
+    return {'popularity_min': low, 'popularity_max': rng.randint(low + 1, 100)}
+
+def server_command(server, port, workers, threads):
+    if server == 'waitress':
+        # waitress is a single process; --workers does not apply
+        return [sys.executable, '-m', 'waitress', f'--listen=127.0.0.1:{port}', f'--threads={threads}', 'app:app']
+    return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--threads', str(threads), '--timeout', '600', 'app:app']
+
+def wait_until_ready(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode} during startup")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            conn.request('GET', '/')
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+def process_rss(pid):
+    """Resident set size of ``pid`` in bytes, or None once it has exited."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class RssSampler:
+    """Track the peak RSS of a server process and its worker processes (Linux only)."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        for pid in [self.pid] + _children(self.pid):
+            rss = process_rss(pid)
+            if rss is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0), rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peaks = {}
+        if os.path.isdir('/proc'):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        return False
+
+def _user(port, mix, seed, deadline, accept_encoding, results):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    while time.monotonic() < deadline:
+        params = popularity_params(mix, rng)
+        path = '/?' + urlencode(params) if params else '/'
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            size = len(response.read())
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            size, ok = 0, False
+        results.append((time.perf_counter() - started, ok, size))
+    conn.close()
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def drive(port, concurrency, duration, mix, seed=0, accept_encoding='gzip, br'):
+    """
+    Run ``concurrency`` simulated users for ``duration`` seconds.
+
+    Returns:
+        dict with requests, errors, throughput (req/s), bytes per response and
+        p50/p95/p99/max latency in milliseconds
+    """
+    results = []
+    deadline = time.monotonic() + duration
+    users = [
+        threading.Thread(target=_user, args=(port, mix, seed * 1000 + i, deadline, accept_encoding, results))
+        for i in range(concurrency)
+    ]
+    started = time.monotonic()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(latency * 1000 for latency, ok, _ in results if ok)
+    ok_sizes = [size for _, ok, size in results if ok]
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(1 for _, ok, _ in results if not ok),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'bytes_per_response': sum(ok_sizes) / len(ok_sizes) if ok_sizes else 0,
+        'p50_ms': _percentile(latencies, 0.50),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+    }
+
+def run_loadtest(args):
+    data_path = args.data or synthetic_path(args.data_dir, parse_size(args.rows), args.seed)
+    concurrency_levels = [int(level) for level in args.concurrency.split(',')]
+    report = {
+        'server': args.server, 'workers': args.workers if args.server == 'gunicorn' else 1,
+        'threads': args.threads, 'data_path': data_path, 'mix': args.mix, 'levels': [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as scratch:
+        env = dict(
+            os.environ,
+            DATA_PATH=os.path.abspath(data_path),
+            DATA_SNAPSHOT_DIR=os.path.join(scratch, 'snapshots'),
+            DATA_RELOAD_INTERVAL='0',
+            PYTHONPATH=REPO_DIR,
+        )
+        for assignment in args.env or []:
+            name, _, value = assignment.partition('=')
+            env[name] = value
+
+        log_path = os.path.join(scratch, 'server.log')
+        with open(log_path, 'w') as log:
+            command = server_command(args.server, args.port, args.workers, args.threads)
+            print(f"Starting: {' '.join(command)} (DATA_PATH={data_path})", flush=True)
+            process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+            try:
+                started = time.monotonic()
+                wait_until_ready(args.port, process, args.startup_timeout)
+                report['startup_seconds'] = time.monotonic() - started
+                print(f"Ready after {report['startup_seconds']:.1f}s", flush=True)
+
+                if args.warmup:
+                    drive(args.port, max(concurrency_levels), args.warmup, args.mix, args.seed)
+
+                for level in concurrency_levels:
+                    with RssSampler(process.pid) as sampler:
+                        result = drive(args.port, level, args.duration, args.mix, args.seed)
+                    result['rss_bytes'] = {str(pid): rss for pid, rss in sorted(sampler.peaks.items())}
+                    report['levels'].append(result)
+                    print(format_level(result, process.pid), flush=True)
+            finally:
+                process.send_signal(signal.SIGTERM)
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                if process.returncode not in (0, -signal.SIGTERM, None) or args.show_log:
+                    with open(log_path) as f:
+                        print(f.read()[-4000:])
+    return report
+
+def format_level(result, server_pid):
+    workers = {int(pid): rss for pid, rss in result['rss_bytes'].items()}
+    # gunicorn's arbiter does no request work; report it apart from the workers
+    worker_rss = [rss for pid, rss in workers.items() if pid != server_pid] or list(workers.values())
+    rss = ', '.join(f"{rss / 2**20:.0f}" for rss in worker_rss)
+    return (f"c={result['concurrency']:<4} {result['throughput']:8.1f} req/s  "
+            f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f}  "
+            f"max {result['max_ms']:7.1f} ms  errors {result['errors']}/{result['requests']}  "
+            f"{result['bytes_per_response'] / 1024:.0f} KiB/resp  worker RSS MB [{rss}]  "
+            f"total {sum(workers.values()) / 2**20:.0f} MB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the dashboard under waitress or gunicorn.')
+    parser.add_argument('--server', choices=('waitress', 'gunicorn'), default='waitress')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per worker (waitress: total threads)')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--rows', default='50k', help='Synthetic dataset size: 500, 50k, 1m, 5m or a number')
+    parser.add_argument('--data', help='Serve this CSV instead of a synthetic dataset')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where synthetic datasets are cached')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated numbers of simultaneous users')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of untimed load before measuring')
+    parser.add_argument('--mix', choices=MIXES, default='realistic', help='Popularity filter mix')
+    parser.add_argument('--startup-timeout', type=float, default=600)
+    parser.add_argument('--env', action='append', help='NAME=value passed to the server (repeatable)')
+    parser.add_argument('--output', help='Write the report as JSON here')
+    parser.add_argument('--show-log', action='store_true', help='Print the tail of the server log')
+    args = parser.parse_args()
+
+    report = run_loadtest(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,219 @@
+"""
+Time and memory-profile the data loaders and chart builders on synthetic datasets.
+
+Each benchmark reports the median wall time over several runs and the peak
+memory allocated during one extra run (tracemalloc), and is compared against
+the stored baselines:
+
+    python -m benchmarks.run --sizes 500,50k          # report, exit 1 on regressions
+    python -m benchmarks.run --sizes 500,50k --save-baseline
+    python -m benchmarks.run --sizes 1m --only chart: --repeats 3
+
+Baselines are machine specific; record them on the hardware being compared.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import DEFAULT_DATA_DIR, parse_size, synthetic_path
+from utils import data_loader
+from utils.aggregates import PopularityCube
+from utils.caching import _hash_frame
+from utils.dashboard import CHARTS
+from utils.data_loader import GenreIndex, genre_index, load_data, load_prepared_data
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baselines.json')
+# Popularity range passed to the filtered charts
+FILTER_RANGE = (20, 80)
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.005
+MIN_BYTES_DELTA = 1 << 20
+
+def measure(func, repeats=5, memory=True):
+    """
+    Benchmark ``func()``.
+
+    Args:
+        func (callable): Code under test, called without arguments
+        repeats (int): Timed runs; the median is reported
+        memory (bool): Also record the peak allocation of one more run
+
+    Returns:
+        dict with seconds (median), min_seconds and peak_bytes (None when not measured)
+    """
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': statistics.median(times), 'min_seconds': min(times), 'peak_bytes': peak}
+
+def _chart_call(chart, df):
+    # The undecorated builder, so every run renders instead of hitting the plot cache
+    builder = chart.builder.__wrapped__
+    if chart.filtered:
+        return lambda: builder(df, FILTER_RANGE, output='json')
+    return lambda: builder(df, output='json')
+
+def benchmarks_for(path, snapshot_dir):
+    """
+    Yield (name, callable) pairs for one dataset file.
+
+    Loaders come first; chart builders and derived tables then share one
+    prepared frame whose derived tables are already built, as in the app.
+    """
+    data_loader.SNAPSHOT_DIR = snapshot_dir
+    yield 'load:csv', lambda: load_data(path, use_snapshot=False)
+    yield 'load:prepared_csv', lambda: load_prepared_data(path, use_snapshot=False)
+    load_prepared_data(path)  # writes the snapshots read below
+    yield 'load:snapshot', lambda: load_data(path)
+    yield 'load:prepared_snapshot', lambda: load_prepared_data(path)
+
+    df = load_prepared_data(path)
+    yield 'derived:genre_index', lambda: GenreIndex.from_lists(df['genres'])
+    genre_index(df)
+    yield 'derived:popularity_cube', lambda: PopularityCube.from_frame(df)
+    yield 'derived:fingerprint', lambda: _hash_frame(df)
+
+    for name, chart in CHARTS.items():
+        call = _chart_call(chart, df)
+        call()  # builds the derived tables this chart relies on
+        yield f'chart:{name}', call
+
+def run(sizes, repeats=5, memory=True, only=None, data_dir=DEFAULT_DATA_DIR, seed=0):
+    """
+    Run every benchmark on every dataset size.
+
+    Returns:
+        dict mapping '<rows>/<benchmark>' to the result of :func:`measure`
+    """
+    results = {}
+    for n_rows in sizes:
+        path = synthetic_path(data_dir, n_rows, seed)
+        with tempfile.TemporaryDirectory(prefix='bench-snapshots-') as snapshot_dir:
+            for name, func in benchmarks_for(path, snapshot_dir):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                key = f"{n_rows}/{name}"
+                result = measure(func, repeats, memory)
+                results[key] = result
+                peak = f"{result['peak_bytes'] / 2**20:8.1f} MB" if result['peak_bytes'] is not None else ''
+                print(f"{key:<48} {result['seconds'] * 1000:10.1f} ms {peak}", flush=True)
+    return results
+
+def load_baselines(path=DEFAULT_BASELINE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('results', {})
+    except (OSError, ValueError):
+        return {}
+
+def save_baselines(results, path=DEFAULT_BASELINE_PATH):
+    # Merged into the stored file so sizes can be recorded in separate runs
+    stored = load_baselines(path)
+    stored.update(results)
+    document = {
+        'meta': {
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'results': dict(sorted(stored.items())),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+        f.write('\n')
+
+def compare(results, baselines, threshold=1.25):
+    """
+    Compare results with baselines.
+
+    Args:
+        results (dict): Output of :func:`run`
+        baselines (dict): Stored results of an earlier run
+        threshold (float): Ratio above which a slowdown or memory increase is a regression
+
+    Returns:
+        Tuple of (report lines, names of regressed benchmarks)
+    """
+    lines = [f"{'benchmark':<48} {'ms':>10} {'base ms':>10} {'ratio':>7} {'peak MB':>9} {'base MB':>9}  status"]
+    regressions = []
+    for key, result in results.items():
+        base = baselines.get(key)
+        if base is None:
+            lines.append(f"{key:<48} {result['seconds'] * 1000:10.1f} {'':>10} {'':>7} "
+                         f"{_megabytes(result['peak_bytes']):>9} {'':>9}  new")
+            continue
+
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        problems = []
+        if ratio > threshold and result['seconds'] - base['seconds'] > MIN_SECONDS_DELTA:
+            problems.append('slower')
+        if (result['peak_bytes'] is not None and base.get('peak_bytes')
+                and result['peak_bytes'] > base['peak_bytes'] * threshold
+                and result['peak_bytes'] - base['peak_bytes'] > MIN_BYTES_DELTA):
+            problems.append('more memory')
+        if problems:
+            regressions.append(key)
+        status = 'REGRESSION: ' + ', '.join(problems) if problems else ('faster' if ratio < 1 / threshold else 'ok')
+        lines.append(f"{key:<48} {result['seconds'] * 1000:10.1f} {base['seconds'] * 1000:10.1f} {ratio:7.2f} "
+                     f"{_megabytes(result['peak_bytes']):>9} {_megabytes(base.get('peak_bytes')):>9}  {status}")
+    return lines, regressions
+
+def _megabytes(value):
+    return '' if value is None else f"{value / 2**20:.1f}"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data loaders and chart builders.')
+    parser.add_argument('--sizes', default='500,50k', help='Comma-separated row counts: 500, 50k, 1m, 5m or numbers')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per benchmark')
+    parser.add_argument('--only', action='append', help='Run benchmarks whose name contains this text (repeatable)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where synthetic datasets are cached')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baselines')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Ratio to baseline that counts as a regression')
+    parser.add_argument('--output', help='Also write the raw results as JSON here')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    results = run(sizes, args.repeats, not args.no_memory, args.only, args.data_dir, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+        print(f"\nSaved {len(results)} baselines to {args.baseline}")
+    else:
+        lines, regressions = compare(results, load_baselines(args.baseline), args.threshold)
+        print()
+        print('\n'.join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:g}x baseline")
+            raise SystemExit(1)
+        print(f"\nNo regressions above {args.threshold:g}x baseline")
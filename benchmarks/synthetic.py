@@ -0,0 +1,151 @@
+"""
+Seeded synthetic datasets with the schema of data/top_500songs_with_fixed_genres.csv.
+
+Rows are artist x track pairs like the real export: most tracks credit one
+artist, some two or three; artist frequency follows a power law so a few
+artists dominate; artists carry zero to four genres drawn from a skewed
+vocabulary; release dates lean recent and a few have year precision only.
+
+    python -m benchmarks.synthetic --rows 1m --out benchmarks/.data/synthetic_1m.csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.pipeline import COLUMNS
+
+# Generated datasets are cached here between runs
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+SIZES = {'500': 500, '50k': 50_000, '1m': 1_000_000, '5m': 5_000_000}
+
+_BASE_GENRES = ['pop', 'rock', 'rap', 'hip hop', 'r&b', 'soul', 'indie', 'folk', 'jazz', 'house',
+                'techno', 'trap', 'drill', 'metal', 'punk', 'country', 'reggaeton', 'afrobeats',
+                'k-pop', 'j-pop', 'edm', 'lo-fi', 'gospel', 'blues', 'funk', 'disco', 'grunge', 'emo']
+_MODIFIERS = ['', 'indie', 'alternative', 'dark', 'bedroom', 'uk', 'atl', 'latin', 'chill',
+              'modern', 'classic', 'underground', 'melodic', 'art', 'dream', 'hyper', 'neo']
+_ALPHABET = np.array(list('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'))
+
+def parse_size(value):
+    """Turn '50k', '1m' or '5000' into a row count."""
+    value = str(value).lower()
+    if value in SIZES:
+        return SIZES[value]
+    if value.endswith('k'):
+        return int(float(value[:-1]) * 1_000)
+    if value.endswith('m'):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+def _spotify_ids(rng, n):
+    # 22 base-62 characters, like real Spotify IDs
+    chars = _ALPHABET[rng.integers(0, len(_ALPHABET), size=(n, 22))]
+    return np.ascontiguousarray(chars).view('<U22').ravel()
+
+def _power_law(rng, n_items, size, exponent=1.1):
+    weights = 1.0 / np.arange(1, n_items + 1) ** exponent
+    return rng.choice(n_items, size=size, p=weights / weights.sum())
+
+def _artists(rng, n_artists):
+    vocabulary = [f"{m} {g}".strip() for g in _BASE_GENRES for m in _MODIFIERS]
+    rng.shuffle(vocabulary)
+    n_genres = rng.choice([0, 1, 2, 3, 4], size=n_artists, p=[0.15, 0.35, 0.25, 0.15, 0.10])
+    picks = _power_law(rng, len(vocabulary), int(n_genres.sum()), exponent=0.9)
+    genres, start = [], 0
+    for count in n_genres:
+        # Duplicate picks collapse, as an artist lists each genre once
+        genres.append(list(dict.fromkeys(vocabulary[i] for i in picks[start:start + count])))
+        start += count
+    return pd.DataFrame({
+        'artist_id': _spotify_ids(rng, n_artists),
+        'artist_name': [f"Artist {i}" for i in range(n_artists)],
+        'genres': [repr(g) for g in genres],
+        'popularity': rng.integers(0, 101, size=n_artists),
+        'followers': np.round(rng.lognormal(10, 2.5, size=n_artists)).astype(np.int64),
+        'num_genres': [len(g) for g in genres],
+    })
+
+def _release_dates(rng, n):
+    years = (2024 - np.floor(rng.beta(1.2, 4.0, size=n) * 64)).astype(int)
+    months = rng.integers(1, 13, size=n)
+    days = rng.integers(1, 29, size=n)
+    full = (pd.Series(days).astype(str).str.zfill(2) + '-' + pd.Series(months).astype(str).str.zfill(2)
+            + '-' + pd.Series(years).astype(str))
+    year_only = rng.random(n) < 0.02
+    return np.where(year_only, years.astype(str), full.to_numpy())
+
+def _chunk(rng, artists, first_track, n_rows):
+    # Credited artists per track, trimmed so the chunk has exactly n_rows rows
+    credits = rng.choice([1, 2, 3], size=n_rows, p=[0.75, 0.18, 0.07])
+    credits = credits[:np.searchsorted(np.cumsum(credits), n_rows) + 1]
+    credits[-1] -= credits.sum() - n_rows
+    n_tracks = len(credits)
+
+    track_numbers = np.arange(first_track, first_track + n_tracks)
+    track_ids = _spotify_ids(rng, n_tracks)
+    tracks = pd.DataFrame({
+        'track_track_id': track_ids,
+        'track_track_name': [f"Track {i}" for i in track_numbers],
+        'track_popularity': np.clip(np.round(rng.normal(45, 20, size=n_tracks)), 0, 100).astype(int),
+        'track_duration_ms': np.round(rng.lognormal(12.2, 0.25, size=n_tracks)).astype(np.int64),
+        'track_explicit': np.where(rng.random(n_tracks) < 0.35, 'TRUE', 'FALSE'),
+        'track_release_date': _release_dates(rng, n_tracks),
+        'track_album_name': [f"Album {i // 8}" for i in track_numbers],
+        'track_spotify_url': np.char.add('https://open.spotify.com/track/', track_ids),
+    }).iloc[np.repeat(np.arange(n_tracks), credits)].reset_index(drop=True)
+
+    credited = artists.iloc[_power_law(rng, len(artists), n_rows, exponent=0.8)].reset_index(drop=True)
+    return pd.concat([credited, tracks], axis=1)[COLUMNS], n_tracks
+
+def write_synthetic(path, n_rows, seed=0, chunk_rows=250_000):
+    """
+    Write a synthetic dataset CSV, generated in chunks so memory stays bounded.
+
+    Args:
+        path (str): Output CSV path
+        n_rows (int): Number of artist x track rows
+        seed (int): Random seed; the same seed and size give the same file
+        chunk_rows (int): Rows generated and written at a time
+
+    Returns:
+        path
+    """
+    rng = np.random.default_rng(seed)
+    artists = _artists(rng, max(50, n_rows // 3))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    written, first_track = 0, 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        while written < n_rows:
+            rows = min(chunk_rows, n_rows - written)
+            chunk, n_tracks = _chunk(rng, artists, first_track, rows)
+            chunk.to_csv(f, header=written == 0, index=False)
+            written += rows
+            first_track += n_tracks
+    os.replace(tmp_path, path)
+    return path
+
+def synthetic_path(data_dir, n_rows, seed=0):
+    """Return the path of a cached synthetic dataset, generating it on first use."""
+    path = os.path.join(data_dir, f"synthetic_{n_rows}_s{seed}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {n_rows} synthetic rows in {path}...")
+        write_synthetic(path, n_rows, seed)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset with the dashboard CSV schema.')
+    parser.add_argument('--rows', default='50k', help='Row count: 500, 50k, 1m, 5m or a number')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Output CSV (default benchmarks/.data/synthetic_<rows>_s<seed>.csv)')
+    args = parser.parse_args()
+
+    n_rows = parse_size(args.rows)
+    out = args.out or os.path.join(DEFAULT_DATA_DIR, f"synthetic_{n_rows}_s{args.seed}.csv")
+    write_synthetic(out, n_rows, args.seed)
+    print(f"Wrote {n_rows} rows to {out}")
@@ -2,8 +2,14 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import json
+import sys
+import time
+import requests
+from utils.ingestion import Checkpoint, Scheduler
+from utils.pipeline import NdjsonWriter
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,51 +20,166 @@ REDIRECT_URI = os.getenv('SPOTIPY_REDIRECT_URI', 'http://localhost:8000/callback
 
 # Scope for accessing user's top tracks and artist info
 SCOPE = 'user-top-read'
+TIME_RANGE = 'medium_term'
+TRACK_LIMIT = 500
+# Tracks per page of the top tracks endpoint
+PAGE_SIZE = 50
 
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-    client_id=CLIENT_ID,
-    client_secret=CLIENT_SECRET,
-    redirect_uri=REDIRECT_URI,
-    scope=SCOPE
-))
+# Point the client elsewhere (e.g. a local stub server) and skip OAuth with a fixed token
+API_PREFIX = os.getenv('SPOTIFY_API_PREFIX', 'https://api.spotify.com/v1/')
+ACCESS_TOKEN = os.getenv('SPOTIFY_ACCESS_TOKEN')
 
+# The several-artists endpoint accepts at most 50 IDs per request
+ARTIST_BATCH_SIZE = 50
+FETCH_WORKERS = int(os.getenv('SPOTIFY_FETCH_WORKERS', 4))
+# Pages of tracks are held back until their artists fill this many batches, so the
+# artist requests run in parallel and artists shared between pages are fetched once
+ARTIST_FETCH_MIN_IDS = int(os.getenv('ARTIST_FETCH_MIN_IDS', ARTIST_BATCH_SIZE * FETCH_WORKERS))
 
-def get_top_tracks(limit=100, time_range='medium_term'):
+# Artist details rarely change, so they are kept on disk between runs
+ARTIST_CACHE_PATH = os.getenv('ARTIST_CACHE_PATH', os.path.join('data', '.cache', 'artists.json'))
+ARTIST_CACHE_TTL_SECONDS = float(os.getenv('ARTIST_CACHE_TTL', 7 * 24 * 60 * 60))
+
+# Track records are written one JSON object per line while they are fetched
+OUTPUT_PATH = os.getenv('TRACKS_OUTPUT_PATH', 'top_500songs_detailed.ndjson')
+
+_sp = None
+# Every API call goes through one rate limiter with retries
+scheduler = Scheduler()
+
+
+def get_client():
+    # Created on first use so importing this module never starts an OAuth flow
+    # A plain session turns off spotipy's own retries, which hide Retry-After from the scheduler
+    global _sp
+    if _sp is None:
+        if ACCESS_TOKEN:
+            _sp = spotipy.Spotify(auth=ACCESS_TOKEN, requests_session=requests.Session())
+        else:
+            _sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+                client_id=CLIENT_ID,
+                client_secret=CLIENT_SECRET,
+                redirect_uri=REDIRECT_URI,
+                scope=SCOPE
+            ), requests_session=requests.Session())
+        _sp.prefix = API_PREFIX
+    return _sp
+
+
+def iter_top_track_pages(limit=100, time_range='medium_term', start=0):
     # Spotify API returns max 50 tracks per request, so we need to paginate
-    tracks = []
-    for offset in range(0, limit, 50):
-        response = sp.current_user_top_tracks(limit=min(50, limit - offset), offset=offset, time_range=time_range)
+    for offset in range(start, limit, PAGE_SIZE):
+        page_limit = min(PAGE_SIZE, limit - offset)
+        response = scheduler.call(
+            get_client().current_user_top_tracks, limit=page_limit, offset=offset, time_range=time_range
+        )
         items = response['items'] if response and 'items' in response and response['items'] is not None else []
-        tracks.extend(items)
-        if len(items) < 50:
+        yield items
+        if len(items) < PAGE_SIZE:
             break
-    return tracks
 
 
-# Helper to get artist details (genres, popularity, followers)
-def get_artist_details(artist_id):
+def get_top_tracks(limit=100, time_range='medium_term'):
+    return [track for page in iter_top_track_pages(limit, time_range) for track in page]
+
+
+def load_artist_cache(path=ARTIST_CACHE_PATH, ttl_seconds=ARTIST_CACHE_TTL_SECONDS):
+    # artist_id -> {'fetched_at': ..., 'details': ...}, without entries older than the TTL
     try:
-        artist = sp.artist(artist_id)
-        if artist is not None:
-            return {
-                'artist_id': artist['id'],
-                'artist_name': artist['name'],
-                'genres': artist.get('genres', []),
-                'popularity': artist.get('popularity', None),
-                'followers': artist.get('followers', {}).get('total', None)
-            }
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    cutoff = time.time() - ttl_seconds
+    return {artist_id: entry for artist_id, entry in entries.items() if entry.get('fetched_at', 0) > cutoff}
+
+
+def save_artist_cache(cache, path=ARTIST_CACHE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write then rename so an interrupted run never leaves a truncated cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _artist_record(artist):
+    return {
+        'artist_id': artist['id'],
+        'artist_name': artist['name'],
+        'genres': artist.get('genres', []),
+        'popularity': artist.get('popularity', None),
+        'followers': (artist.get('followers') or {}).get('total', None)
+    }
+
+
+def _fetch_artist_batch(artist_ids):
+    response = scheduler.call(get_client().artists, artist_ids)
+    # Unknown IDs come back as null entries
+    artists = response.get('artists', []) if response else []
+    return {artist['id']: _artist_record(artist) for artist in artists if artist}
+
+
+def get_artists_details(artist_ids, cache=None, cache_path=None):
+    """
+    Fetch details for many artists, each at most once.
+
+    IDs are deduplicated, looked up in the cache, and the rest requested in
+    batches of 50 from a bounded thread pool.
+
+    Args:
+        artist_ids (iterable): Artist IDs, duplicates allowed
+        cache (dict): Loaded artist cache, updated in place; None disables caching
+        cache_path (str): Save the cache here after every batch, so an interrupted
+            run resumes with the artists it already fetched
+
+    Returns:
+        dict mapping artist ID to details, without artists unknown to the API
+    """
+    unique_ids = list(dict.fromkeys(artist_ids))
+    details = {}
+    missing = []
+    for artist_id in unique_ids:
+        entry = cache.get(artist_id) if cache is not None else None
+        if entry is not None:
+            details[artist_id] = entry['details']
         else:
-            return None
-    except Exception:
-        return None
+            missing.append(artist_id)
+
+    batches = [missing[i:i + ARTIST_BATCH_SIZE] for i in range(0, len(missing), ARTIST_BATCH_SIZE)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(batches)))) as pool:
+            futures = [pool.submit(_fetch_artist_batch, batch) for batch in batches]
+            try:
+                for future in as_completed(futures):
+                    fetched = future.result()
+                    details.update(fetched)
+                    if cache is not None:
+                        now = time.time()
+                        for artist_id, record in fetched.items():
+                            cache[artist_id] = {'fetched_at': now, 'details': record}
+                        if cache_path:
+                            save_artist_cache(cache, cache_path)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    print(f"Artists: {len(unique_ids)} unique, {len(unique_ids) - len(missing)} cached, "
+          f"{len(missing)} requested in {len(batches)} batches")
+    return details
 
 
 # Helper to get song details in the requested format
-def get_track_details(track):
-    # Get artist details for all artists
+def get_track_details(track, artist_details=None):
+    # Artist details are normally fetched for the whole track set up front
+    if artist_details is None:
+        artist_details = get_artists_details(artist['id'] for artist in track.get('artists', []))
     artists = []
     for artist in track.get('artists', []):
-        details = get_artist_details(artist['id'])
+        details = artist_details.get(artist['id'])
         if details:
             artists.append(details)
         else:
@@ -82,14 +203,59 @@ def get_track_details(track):
     }
 
 
+def iter_detailed_tracks(pages, cache=None, cache_path=None, min_artists=ARTIST_FETCH_MIN_IDS):
+    """
+    Turn pages of tracks into detailed records, fetching artists for several pages at once.
+
+    Args:
+        pages (iterable): Lists of track objects, as yielded by iter_top_track_pages
+        cache (dict): Loaded artist cache, passed to get_artists_details
+        cache_path (str): Where get_artists_details saves the cache
+        min_artists (int): Unique artists to collect before fetching their details
+
+    Yields:
+        Detailed track records in page order
+    """
+    tracks, artist_ids = [], {}
+    for page in pages:
+        tracks.extend(page)
+        artist_ids.update((artist['id'], None) for track in page for artist in track.get('artists', []))
+        if len(artist_ids) >= min_artists:
+            artist_details = get_artists_details(artist_ids, cache=cache, cache_path=cache_path)
+            for track in tracks:
+                yield get_track_details(track, artist_details)
+            tracks, artist_ids = [], {}
+    if tracks:
+        artist_details = get_artists_details(artist_ids, cache=cache, cache_path=cache_path)
+        for track in tracks:
+            yield get_track_details(track, artist_details)
+
+
 if __name__ == '__main__':
-    top_tracks = get_top_tracks(limit=500)
-    print("Fetching artist details for all tracks. This may take a while...")
-    all_details = []
-    for track in top_tracks:
-        details = get_track_details(track)
-        all_details.append(details)
-    # Save as JSON
-    with open('top_500songs_detailed.json', 'w', encoding='utf-8') as f:
-        json.dump(all_details, f, ensure_ascii=False, indent=2)
-    print("Saved detailed track data to top_500songs_detailed.json")
\ No newline at end of file
+    checkpoint = Checkpoint()
+    artist_cache = load_artist_cache()
+    print("Fetching top tracks and their artists...")
+    try:
+        # An interrupted run leaves its records in OUTPUT_PATH.partial and the offset of the
+        # first page not fully written in the checkpoint; the next run appends from there
+        with NdjsonWriter(OUTPUT_PATH, resume=True) as out:
+            start = checkpoint.get('pages', TIME_RANGE, 0) if out.count else 0
+            if start:
+                print(f"Resuming at track {start} with {out.count} records already written")
+            position = start
+            # Records reach the file a few pages at a time, while later pages are still being fetched
+            pages = iter_top_track_pages(limit=TRACK_LIMIT, time_range=TIME_RANGE, start=start)
+            for record in iter_detailed_tracks(pages, cache=artist_cache, cache_path=ARTIST_CACHE_PATH):
+                if record['track_id'] not in out.resumed_keys:
+                    out.write(record)
+                position += 1
+                if position % PAGE_SIZE == 0:
+                    checkpoint.put('pages', TIME_RANGE, position)
+    except Exception as e:
+        print(f"Error fetching data: {str(e)}")
+        print(f"Progress is saved; run again to fetch only what is missing. {scheduler.stats.summary()}")
+        sys.exit(1)
+    checkpoint.clear()
+    print(f"API usage: {scheduler.stats.summary()}")
+    print(f"Saved {out.count} detailed track records to {OUTPUT_PATH}")
+    print(f"Build the dashboard dataset with: python -m utils.pipeline {OUTPUT_PATH} <output.csv>")
@@ -0,0 +1,67 @@
+// Hydrates the JSON figure specs emitted by visualizations.plot_utils.render_figure and,
+// in lazy mode, fetches chart shells from /api/charts/<name> as they scroll into view
+(function() {
+    const config = {responsive: true};
+    // One request per chart URL, even when it fills several shells
+    const requests = new Map();
+
+    function hydrate(container) {
+        const source = container.querySelector('script[type="application/json"]');
+        if (!source) {
+            return;
+        }
+        const spec = JSON.parse(source.textContent);
+        source.remove();
+        Plotly.newPlot(container, spec.data || [], spec.layout || {}, config);
+    }
+
+    function fetchChart(src) {
+        if (!requests.has(src)) {
+            requests.set(src, fetch(src).then(function(response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.json();
+            }));
+        }
+        return requests.get(src);
+    }
+
+    function load(shell) {
+        fetchChart(shell.dataset.src).then(function(figures) {
+            const spec = figures[shell.dataset.output];
+            shell.classList.remove('loading');
+            Plotly.newPlot(shell, spec.data || [], spec.layout || {}, config);
+        }).catch(function() {
+            shell.classList.remove('loading');
+            shell.innerHTML = "<div class='error-message'>Error loading chart</div>";
+        });
+    }
+
+    function hydrateAll(root) {
+        root.querySelectorAll('.plotly-chart').forEach(hydrate);
+
+        const shells = root.querySelectorAll('.chart-shell');
+        if (!('IntersectionObserver' in window)) {
+            shells.forEach(load);
+            return;
+        }
+        const observer = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    load(entry.target);
+                }
+            });
+        }, {rootMargin: '200px'});
+        shells.forEach(function(shell) { observer.observe(shell); });
+    }
+
+    window.SpotifyDashboard = {hydrate: hydrate, hydrateAll: hydrateAll};
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', function() { hydrateAll(document); });
+    } else {
+        hydrateAll(document);
+    }
+})();
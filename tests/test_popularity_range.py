@@ -0,0 +1,38 @@
+import math
+
+import pytest
+
+from utils.page_cache import quantize_range
+
+
+@pytest.mark.parametrize('popularity_range, expected', [
+    ((math.inf, math.inf), (100, 100)),
+    ((-math.inf, math.inf), (0, 100)),
+    ((-math.inf, -math.inf), (0, 0)),
+    ((float('1e400'), 50), (100, 50)),
+])
+def test_quantize_range_clamps_infinite_bounds(popularity_range, expected):
+    assert quantize_range(popularity_range, step=1) == expected
+    assert quantize_range(popularity_range, step=0) == expected
+
+
+@pytest.fixture(scope='module')
+def client():
+    from app import app
+    return app.test_client()
+
+
+@pytest.mark.parametrize('value, status', [('inf', 200), ('-inf', 200), ('1e400', 200), ('nan', 400)])
+def test_chart_api_non_finite_popularity(client, value, status):
+    for name in ('genre_distribution', 'duration_by_genre'):
+        response = client.get(f'/api/charts/{name}?popularity_min={value}')
+        assert response.status_code == status, name
+        if status == 400:
+            assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', '1e400'])
+def test_dashboard_renders_infinite_popularity(client, value):
+    response = client.get(f'/?popularity_max={value}')
+    assert response.status_code == 200
+    assert b'error-container' not in response.data
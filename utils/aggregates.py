@@ -0,0 +1,149 @@
+"""Precomputed aggregates answering popularity-range filters without touching row data."""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import derived, genre_index
+
+# Track popularity is an integer score from 0 to 100
+POPULARITY_BUCKETS = 101
+
+class PopularityCube:
+    """
+    Per-genre aggregates over popularity buckets, stored as prefix sums.
+
+    Row ``b`` of each table holds totals over tracks with popularity below ``b``,
+    so any range ``[lo, hi]`` is ``table[hi + 1] - table[lo]``: one subtraction
+    per genre regardless of the number of rows.
+    """
+
+    def __init__(self, vocabulary, genre_counts, popularity_sums, duration_sums, row_counts):
+        self.vocabulary = vocabulary
+        self.genre_counts = genre_counts
+        self.popularity_sums = popularity_sums
+        self.duration_sums = duration_sums
+        self.row_counts = row_counts
+
+    @classmethod
+    def from_frame(cls, df):
+        index = genre_index(df)
+        n_genres = len(index.vocabulary)
+        popularity = df['popularity'].fillna(0).to_numpy()
+        buckets = np.clip(popularity, 0, POPULARITY_BUCKETS - 1).astype(np.int64)
+
+        # One bincount per measure over (bucket, genre) cells of the exploded rows
+        cells = buckets[index.row_map] * n_genres + index.codes
+        size = POPULARITY_BUCKETS * n_genres
+
+        def per_cell(weights=None):
+            totals = np.bincount(cells, weights=weights, minlength=size).reshape(POPULARITY_BUCKETS, n_genres)
+            return _prefix_sums(totals)
+
+        return cls(
+            index.vocabulary,
+            per_cell(),
+            per_cell(popularity[index.row_map].astype(np.float64)),
+            per_cell(df['duration_ms'].to_numpy(dtype=np.float64)[index.row_map]),
+            _prefix_sums(np.bincount(buckets, minlength=POPULARITY_BUCKETS))
+        )
+
+    def _range(self, table, popularity_range):
+        lo, hi = _bucket_bounds(popularity_range)
+        if lo > hi:
+            return np.zeros_like(table[0])
+        return table[hi + 1] - table[lo]
+
+    def track_count(self, popularity_range=None):
+        """Number of rows whose popularity lies in ``popularity_range``."""
+        return int(self._range(self.row_counts, popularity_range))
+
+    def counts(self, popularity_range=None):
+        """
+        Count rows per genre within a popularity range, most frequent first.
+
+        Args:
+            popularity_range (tuple): Inclusive (min, max) popularity, or None for all
+
+        Returns:
+            Series of counts indexed by genre name, without zero counts
+        """
+        counts = pd.Series(self._range(self.genre_counts, popularity_range), index=self.vocabulary)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+    def top(self, n, popularity_range=None):
+        return self.counts(popularity_range).head(n).index.tolist()
+
+    def summary(self, popularity_range=None, top_n=None):
+        """
+        Per-genre count, mean popularity and mean duration within a popularity range.
+
+        Args:
+            popularity_range (tuple): Inclusive (min, max) popularity, or None for all
+            top_n (int): Keep only the most frequent genres
+
+        Returns:
+            DataFrame indexed by genre with count, mean_popularity and mean_duration_ms
+        """
+        counts = self.counts(popularity_range)
+        if top_n is not None:
+            counts = counts.head(top_n)
+        positions = self.vocabulary.get_indexer(counts.index)
+        values = counts.to_numpy()
+        return pd.DataFrame({
+            'count': values,
+            'mean_popularity': self._range(self.popularity_sums, popularity_range)[positions] / values,
+            'mean_duration_ms': self._range(self.duration_sums, popularity_range)[positions] / values,
+        }, index=counts.index)
+
+def _prefix_sums(totals):
+    prefix = np.zeros((totals.shape[0] + 1,) + totals.shape[1:], dtype=totals.dtype)
+    np.cumsum(totals, axis=0, out=prefix[1:])
+    return prefix
+
+def _bucket_bounds(popularity_range):
+    # Scores are integers, so [1.5, 70.2] selects the same tracks as [2, 70]
+    if not popularity_range:
+        return 0, POPULARITY_BUCKETS - 1
+    lo = max(0, math.ceil(popularity_range[0]))
+    hi = min(POPULARITY_BUCKETS - 1, math.floor(popularity_range[1]))
+    return lo, hi
+
+def histogram_bins(values, bins=30):
+    """
+    Bin values server-side so charts ship counts instead of raw values.
+
+    Args:
+        values (array-like): Values to bin; NaNs are ignored
+        bins (int): Number of equal-width bins
+
+    Returns:
+        Tuple of (counts, edges) as returned by ``np.histogram``
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    return np.histogram(values, bins=bins)
+
+def top_k_per_group(groups, scores, k):
+    """
+    Select the ``k`` highest-scoring rows of every group with a single sort.
+
+    Args:
+        groups (array-like): Integer group label of each row
+        scores (array-like): Score of each row; ties keep row order
+        k (int): Rows to keep per group
+
+    Returns:
+        Positions of the selected rows, ordered by group then descending score
+    """
+    groups = np.asarray(groups)
+    order = np.lexsort((-np.asarray(scores, dtype=np.float64), groups))
+    sorted_groups = groups[order]
+    # Rank within the group = distance from the group's first position in sorted order
+    rank = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups, side='left')
+    return order[rank < k]
+
+def popularity_cube(df):
+    """Return the :class:`PopularityCube` of ``df``, built on first use."""
+    return derived(df, 'popularity_cube', PopularityCube.from_frame)
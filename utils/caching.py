@@ -1,40 +1,327 @@
 """Caching utilities for visualization functions."""
 
+import hashlib
+import inspect
+import json
+import math
+import numbers
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from datetime import datetime, timedelta
 
-_cache = {}
+import pandas as pd
+
+from utils import profiling
+from utils.data_loader import derived, genre_index
+
+# Upper bound on the memory held by cached plots, across all decorated functions
+MAX_CACHE_BYTES = int(os.getenv('PLOT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Optional cache shared by every worker process, e.g. sqlite:///tmp/plots.sqlite3 or redis://host:6379/0
+SHARED_CACHE_URL = os.getenv('PLOT_CACHE_URL', '')
+
+# key -> (result, expires_at, size_in_bytes), least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.RLock()
+_cache_bytes = 0
+_stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'shared_errors': 0}
+# Result of the latest cache_plot lookup made by each thread
+_last_result = threading.local()
+
+class SQLiteBackend:
+    """
+    On-disk cache shared between processes on one host.
+
+    Implements the subset of the redis-py client used by cache_plot (``get``,
+    ``set`` with ``ex`` and ``delete``), so a ``redis.Redis`` instance can be
+    used in its place unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)'
+            )
+
+    def _connection(self):
+        # sqlite connections cannot be shared across threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ex=None):
+        expires_at = time.time() + ex if ex else None
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, value, expires_at))
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        return True
+
+    def delete(self, *keys):
+        with self._connection() as conn:
+            cursor = conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        return cursor.rowcount
+
+def make_backend(url):
+    """
+    Create the shared cache backend described by ``url``.
+
+    Args:
+        url (str): ``sqlite:///path/to/file``, ``redis://...`` or empty for none
+
+    Returns:
+        Backend object, or None when only the per-process cache is used
+    """
+    if not url or url == 'memory':
+        return None
+    if url.startswith('sqlite://'):
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis  # optional dependency, only needed for a Redis backend
+        return redis.Redis.from_url(url)
+    raise ValueError(f"Unsupported plot cache URL: {url}")
+
+_backend = make_backend(SHARED_CACHE_URL)
+
+def _shared_key(key):
+    return 'plot:' + hashlib.sha1(repr(key).encode()).hexdigest()
+
+def _shared_get(key):
+    """Return (result, seconds_left) from the shared backend, or None."""
+    if _backend is None:
+        return None
+    try:
+        payload = _backend.get(_shared_key(key))
+        if payload is None:
+            return None
+        entry = json.loads(payload)
+        result = entry['result']
+        # Multi-figure builders return tuples, which JSON hands back as lists
+        if isinstance(result, list):
+            result = tuple(result)
+        return result, entry['expires_at'] - time.time()
+    except Exception as e:
+        print(f"Warning: shared plot cache read failed: {str(e)}")
+        with _cache_lock:
+            _stats['shared_errors'] += 1
+        return None
+
+def _shared_set(key, result, ttl_seconds):
+    if _backend is None:
+        return
+    try:
+        # JSON rather than pickle so a shared store can never inject executable payloads
+        payload = json.dumps({'result': result, 'expires_at': time.time() + ttl_seconds}).encode()
+        _backend.set(_shared_key(key), payload, ex=max(1, math.ceil(ttl_seconds)))
+    except Exception as e:
+        print(f"Warning: shared plot cache write failed: {str(e)}")
+        with _cache_lock:
+            _stats['shared_errors'] += 1
+
+def _hash_frame(df):
+    digest = hashlib.sha1(repr((df.attrs.get('version'), df.shape, list(df.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    for column in df.columns:
+        if column == 'genres':
+            try:
+                # Genre lists are hashed through the frame's interned genre index
+                index = genre_index(df)
+                digest.update(index.offsets.tobytes())
+                digest.update(index.codes.tobytes())
+                digest.update(pd.util.hash_pandas_object(index.vocabulary, index=False).to_numpy().tobytes())
+                continue
+            except TypeError:
+                pass
+        try:
+            hashed = pd.util.hash_pandas_object(df[column], index=False)
+        except TypeError:
+            # Unhashable cells such as genre lists are hashed through their repr
+            hashed = pd.util.hash_pandas_object(df[column].astype(str), index=False)
+        digest.update(hashed.to_numpy().tobytes())
+    return digest.hexdigest()
+
+def frame_fingerprint(df):
+    """
+    Return a content fingerprint of a DataFrame, computed once per frame object.
+
+    Args:
+        df (DataFrame): Frame to fingerprint
+
+    Returns:
+        Hex digest identifying the frame's contents
+    """
+    return derived(df, 'fingerprint', _hash_frame)
+
+def _normalize(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return ('frame', frame_fingerprint(value.to_frame() if isinstance(value, pd.Series) else value))
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, numbers.Real):
+        # 30, 30.0 and numpy scalars all produce the same key
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    return repr(value)
+
+def _result_size(result):
+    if isinstance(result, (tuple, list)):
+        return sys.getsizeof(result) + sum(_result_size(item) for item in result)
+    return sys.getsizeof(result)
+
+def _discard(key, counter=None):
+    global _cache_bytes
+    _, _, size = _cache.pop(key)
+    _cache_bytes -= size
+    if counter:
+        _stats[counter] += 1
+
+def _store(key, result, expires_at):
+    global _cache_bytes
+    size = _result_size(result)
+    if size > MAX_CACHE_BYTES:
+        return
+
+    with _cache_lock:
+        now = time.monotonic()
+        for stale_key in [k for k, (_, expiry, _) in _cache.items() if expiry <= now]:
+            _discard(stale_key, 'expirations')
+
+        if key in _cache:
+            _discard(key)
+        while _cache and _cache_bytes + size > MAX_CACHE_BYTES:
+            _discard(next(iter(_cache)), 'evictions')
+
+        _cache[key] = (result, expires_at, size)
+        _cache_bytes += size
+
+def cache_stats():
+    """
+    Return counters describing the plot cache.
+
+    Returns:
+        dict with hits, shared_hits, misses, evictions, expirations, shared_errors,
+        entries and bytes
+    """
+    with _cache_lock:
+        return dict(_stats, entries=len(_cache), bytes=_cache_bytes)
+
+def last_cache_result():
+    """Return 'hit', 'shared_hit' or 'miss' for this thread's latest cached call, or None."""
+    return getattr(_last_result, 'value', None)
+
+def _mentions(value, token):
+    if value == token:
+        return True
+    return isinstance(value, tuple) and any(_mentions(item, token) for item in value)
+
+def invalidate_frame(df):
+    """
+    Drop the cached plots drawn from ``df``, e.g. after the dataset is replaced.
+
+    Entries in the shared backend are left to expire: their keys carry the
+    frame's fingerprint, so they are never served for a different frame.
+
+    Args:
+        df (DataFrame): Frame whose plots are no longer needed
+
+    Returns:
+        Number of entries removed
+    """
+    token = ('frame', frame_fingerprint(df))
+    with _cache_lock:
+        stale = [key for key in _cache if _mentions(key[2], token)]
+        for key in stale:
+            _discard(key)
+    return len(stale)
 
 def cache_plot(ttl_seconds=300):
     """
     Cache the output of a plotting function for a specified time.
-    
+
+    Keys combine the function name with a content fingerprint of DataFrame
+    arguments and the normalized remaining arguments, so equivalent calls share
+    an entry. Entries are evicted least recently used first once the cache
+    exceeds MAX_CACHE_BYTES. When a shared backend is configured it is consulted
+    on a local miss, so each figure is rendered once for all worker processes.
+
     Args:
         ttl_seconds (int): Time to live in seconds for cached values
-        
+
     Returns:
         Decorator function that caches plot HTML output
     """
     def decorator(func):
+        signature = inspect.signature(func)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Create cache key from function name and arguments
+            if profiling.bypass_caches():
+                _last_result.value = 'bypass'
+                return func(*args, **kwargs)
+
+            # Bind to the signature so positional, keyword and default arguments agree
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
             cache_key = (
-                func.__name__,
-                str(args),
-                str(sorted(kwargs.items()))
+                func.__module__,
+                func.__qualname__,
+                _normalize(tuple(bound.arguments.items()))
             )
-            
+
             # Check if we have a valid cached value
-            if cache_key in _cache:
-                result, timestamp = _cache[cache_key]
-                if datetime.now() - timestamp < timedelta(seconds=ttl_seconds):
-                    return result
-            
+            with _cache_lock:
+                entry = _cache.get(cache_key)
+                if entry is not None:
+                    if entry[1] > time.monotonic():
+                        _cache.move_to_end(cache_key)
+                        _stats['hits'] += 1
+                        _last_result.value = 'hit'
+                        return entry[0]
+                    _discard(cache_key, 'expirations')
+
+            # Another worker may already have rendered it
+            shared = _shared_get(cache_key)
+            if shared is not None and shared[1] > 0:
+                result, seconds_left = shared
+                with _cache_lock:
+                    _stats['shared_hits'] += 1
+                _last_result.value = 'shared_hit'
+                _store(cache_key, result, time.monotonic() + seconds_left)
+                return result
+
+            with _cache_lock:
+                _stats['misses'] += 1
+            _last_result.value = 'miss'
+
             # Generate and cache new result
             result = func(*args, **kwargs)
-            _cache[cache_key] = (result, datetime.now())
-            
+            _store(cache_key, result, time.monotonic() + ttl_seconds)
+            _shared_set(cache_key, result, ttl_seconds)
+
             return result
         return wrapper
     return decorator
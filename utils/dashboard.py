@@ -0,0 +1,140 @@
+"""Assembly of the dashboard's charts."""
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from utils import metrics, profiling
+from utils.caching import last_cache_result
+from visualizations.genre_trends import genre_distribution, genre_evolution_by_year
+from visualizations.popularity_analysis import (
+    artist_vs_track_popularity,
+    popularity_distribution
+)
+from visualizations.duration_analysis import (
+    duration_distribution,
+    duration_by_genre
+)
+from visualizations.artist_analysis import (
+    most_frequent_artists,
+    artist_popularity_genre
+)
+
+# Threads rather than processes: builders share the loaded frame and the plot cache,
+# and pandas/numpy release the GIL for much of their work
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', 4))
+# Time budget for each chart, measured from the start of the request
+CHART_TIMEOUT_SECONDS = float(os.getenv('CHART_TIMEOUT_SECONDS', 10))
+# Ship only chart shells with the page and let the browser fetch each chart from
+# /api/charts/<name> as it scrolls into view
+LAZY_CHARTS = os.getenv('DASHBOARD_LAZY', '').lower() in ('1', 'true', 'yes')
+
+# builder: chart function; outputs: template variables it fills (in return order);
+# labels: names used in placeholders; filtered: accepts the popularity range;
+# timeout: per-chart budget overriding CHART_TIMEOUT_SECONDS
+Chart = namedtuple('Chart', ['builder', 'outputs', 'labels', 'filtered', 'timeout'], defaults=[False, None])
+
+CHARTS = {
+    'most_frequent_artists': Chart(most_frequent_artists, ('most_frequent_artists',), ('most frequent artists chart',)),
+    'artist_popularity_genre': Chart(artist_popularity_genre, ('artist_popularity_genre',), ('artist popularity by genre chart',)),
+    'genre_distribution': Chart(genre_distribution, ('genre_chart',), ('genre distribution',), True),
+    'artist_vs_track_popularity': Chart(artist_vs_track_popularity, ('pop_chart',), ('popularity chart',)),
+    'popularity_distribution': Chart(
+        popularity_distribution,
+        ('artist_pop_dist', 'track_pop_dist'),
+        ('artist popularity distribution', 'track popularity distribution')
+    ),
+    'duration_distribution': Chart(duration_distribution, ('duration_chart',), ('duration chart',)),
+    'duration_by_genre': Chart(duration_by_genre, ('duration_by_genre',), ('duration by genre chart',), True),
+    'genre_evolution_by_year': Chart(genre_evolution_by_year, ('genre_evolution',), ('genre evolution',)),
+}
+
+_executor = ThreadPoolExecutor(max_workers=CHART_WORKERS, thread_name_prefix='chart')
+
+def build_chart(name, df, popularity_range=None, output='fragment', timings=None):
+    """
+    Run a single chart builder, recording its timing in the metrics.
+
+    Args:
+        name (str): Key of the chart in CHARTS
+        df (DataFrame): Dataset to plot
+        popularity_range (tuple): Popularity filter, used by filtered charts only
+        output (str): 'fragment' for page HTML or 'json' for figure specs
+        timings (dict): If given, receives ``name -> ChartTiming`` for this build
+
+    Returns:
+        Tuple of rendered figures, one per entry of the chart's outputs
+    """
+    chart = CHARTS[name]
+    wall_started, cpu_started = time.perf_counter(), time.thread_time()
+    results, outcome = None, 'error'
+    try:
+        if chart.filtered:
+            result = chart.builder(df, popularity_range, output=output)
+        else:
+            result = chart.builder(df, output=output)
+        results = tuple(result) if len(chart.outputs) > 1 else (result,)
+        outcome = 'ok'
+        return results
+    finally:
+        timing = metrics.ChartTiming(
+            time.perf_counter() - wall_started,
+            # Builders run on their own thread, so thread time is this chart's CPU time
+            time.thread_time() - cpu_started,
+            sum(len(r.encode('utf-8')) for r in results) if results else None,
+            outcome,
+            last_cache_result()
+        )
+        metrics.record_chart(name, timing)
+        if timings is not None:
+            timings[name] = timing
+
+def _placeholder(message):
+    return f"<div class='error-message'>{message}</div>"
+
+def render_charts(df, popularity_range=None, timings=None):
+    """
+    Render every chart concurrently, each within its own time budget.
+
+    A chart that fails or misses its budget is replaced by a placeholder instead of
+    holding up the page; a slow chart keeps running in the background and fills the
+    plot cache for the next request.
+
+    Args:
+        df (DataFrame): Dataset to plot
+        popularity_range (tuple): Popularity filter passed to filtered charts
+        timings (dict): If given, receives ``name -> ChartTiming`` for every chart
+            that finished within its budget
+
+    Returns:
+        Tuple of (dict mapping template variables to rendered fragments, whether every
+        chart rendered in time without errors)
+    """
+    started = time.monotonic()
+    futures = {
+        name: _executor.submit(profiling.propagate(build_chart), name, df, popularity_range, timings=timings)
+        for name in CHARTS
+    }
+
+    rendered = {}
+    complete = True
+    for name, future in futures.items():
+        chart = CHARTS[name]
+        budget = chart.timeout if chart.timeout is not None else CHART_TIMEOUT_SECONDS
+        # A profiled request waits for every chart so the profile covers the whole render
+        timeout = None if profiling.active() else max(0, started + budget - time.monotonic())
+        try:
+            results = future.result(timeout=timeout)
+        except TimeoutError:
+            print(f"Chart {name} missed its {budget:g}s budget")
+            metrics.inc('dashboard_chart_timeouts_total', chart=name)
+            results = [_placeholder(f"The {label} is still loading, refresh to see it") for label in chart.labels]
+            complete = False
+        except Exception as e:
+            print(f"Error generating {name}: {str(e)}")
+            results = [_placeholder(f"Error loading {label}") for label in chart.labels]
+            complete = False
+        rendered.update(zip(chart.outputs, results))
+
+    return rendered, complete
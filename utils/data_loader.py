@@ -1,6 +1,127 @@
+import argparse
+import glob
+import hashlib
+import itertools
+import os
+import threading
+import weakref
+
+import numpy as np
 import pandas as pd
 
-def load_data(path='data/top_500songs_with_fixed_genres.csv'):
+DEFAULT_DATA_PATH = os.getenv('DATA_PATH', 'data/top_500songs_with_fixed_genres.csv')
+# Optional separate source of genres used to backfill rows whose genre list is empty
+DEFAULT_GENRE_FIXES_PATH = os.getenv('GENRE_FIXES_PATH') or None
+
+# Parsed datasets are snapshotted here as Parquet, keyed by a hash of the source file
+SNAPSHOT_DIR = os.getenv('DATA_SNAPSHOT_DIR', os.path.join('data', '.cache'))
+# Bump whenever the parsing below changes so stale snapshots are never reused
+SNAPSHOT_FORMAT_VERSION = 2
+
+# Track pages are this prefix plus the track id, so URLs are not kept per row
+SPOTIFY_TRACK_URL = 'https://open.spotify.com/track/'
+# Repeated strings, kept once per distinct value behind small integer codes
+CATEGORY_COLUMNS = ['artist_id', 'artist_name', 'album_name', 'id', 'name']
+# Integer columns stored in the narrowest width holding their values
+INTEGER_COLUMNS = ['artist_popularity', 'artist_followers', 'popularity', 'duration_ms', 'num_genres']
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Return a short content hash of ``path``, read in chunks to keep memory flat."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _snapshot_path(path, fingerprint, stage='raw', fixes_path=None):
+    # The stem names the inputs rather than their contents, so each (source, fixes)
+    # pair only ever replaces its own older snapshots, even when basenames collide
+    inputs = [os.path.abspath(path)] + ([os.path.abspath(fixes_path)] if fixes_path else [])
+    origin = hashlib.sha256('\0'.join(inputs).encode()).hexdigest()[:8]
+    stem = f"{os.path.splitext(os.path.basename(path))[0]}-{origin}"
+    return os.path.join(SNAPSHOT_DIR, f"{stem}.{stage}.v{SNAPSHOT_FORMAT_VERSION}.{fingerprint}.parquet")
+
+def _read_snapshot(snapshot):
+    if not os.path.exists(snapshot):
+        return None
+    try:
+        df = pd.read_parquet(snapshot)
+        # Parquet hands list columns back as arrays; the visualizations expect lists
+        df['genres'] = _shared_genre_lists(df['genres'])
+        return df
+    except Exception as e:
+        print(f"Warning: could not read data snapshot {snapshot}: {str(e)}")
+        return None
+
+def _write_snapshot(df, snapshot):
+    try:
+        os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+        # Write then rename so concurrent workers never observe a half-written file
+        tmp_path = f"{snapshot}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, snapshot)
+
+        stale_pattern = glob.escape(snapshot.rsplit('.v', 1)[0]) + '.v*.parquet'
+        for stale in glob.glob(stale_pattern):
+            if stale != snapshot:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass  # another worker pruned it first
+    except Exception as e:
+        # Snapshots are an optimisation only (e.g. pyarrow may not be installed)
+        print(f"Warning: could not write data snapshot {snapshot}: {str(e)}")
+
+def track_urls(ids):
+    """Return the Spotify URL of every track id in ``ids``, as a Series aligned with it."""
+    return SPOTIFY_TRACK_URL + ids.astype(object).astype(str)
+
+def _shared_genre_lists(genres):
+    # Rows of the same artist list the same genres and share one list object,
+    # so the lists must be treated as read-only
+    shared = {}
+
+    def share(value):
+        key = tuple(value)
+        found = shared.get(key)
+        if found is None:
+            found = shared[key] = list(key)
+        return found
+
+    return genres.map(share)
+
+def compact_frame(df):
+    """
+    Convert a parsed frame to compact dtypes, in place.
+
+    Repeated strings become categoricals, integers the narrowest type that fits,
+    ``explicit`` a boolean and ``release_year`` a small integer (float32 when
+    some dates are unknown). Identical genre lists are shared between rows and
+    ``spotify_url`` is dropped; :func:`track_urls` rebuilds it from ``id``.
+
+    Args:
+        df (DataFrame): Frame as parsed by :func:`load_data`
+
+    Returns:
+        The same frame
+    """
+    for column in CATEGORY_COLUMNS:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in INTEGER_COLUMNS:
+        # Columns with missing values were parsed as floats and stay that way
+        if column in df and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    if 'explicit' in df and df['explicit'].dtype != bool:
+        df['explicit'] = df['explicit'].astype(str).str.upper().eq('TRUE')
+    if 'release_year' in df:
+        years = df['release_year']
+        df['release_year'] = years.astype(np.int16) if years.notna().all() else years.astype(np.float32)
+    df.drop(columns='spotify_url', errors='ignore', inplace=True)
+    df['genres'] = _shared_genre_lists(df['genres'])
+    return df
+
+def _read_csv(path):
 
     encodings = ['utf-8-sig', 'latin1', 'iso-8859-1', 'cp1252']
     
@@ -41,7 +162,7 @@ def load_data(path='data/top_500songs_with_fixed_genres.csv'):
             # Convert string representations of lists to actual lists for genres
             df['genres'] = df['genres'].apply(lambda x: eval(x) if isinstance(x, str) and x.startswith('[') else ([x] if x and not pd.isna(x) else []))
             
-            return df
+            return compact_frame(df)
             
         except UnicodeDecodeError:
             continue
@@ -51,11 +172,225 @@ def load_data(path='data/top_500songs_with_fixed_genres.csv'):
     
     raise ValueError(f"Could not read the CSV file with any of the attempted encodings: {encodings}")
 
-def load_fixed_genres(path='data/top_500songs_with_fixed_genres.csv'):
+def load_data(path=DEFAULT_DATA_PATH, use_snapshot=True):
+    """
+    Load the track dataset, reusing a Parquet snapshot when the source is unchanged.
 
-    try:
-        df = load_data(path)
-        return df[['id', 'genres']]
-    except Exception as e:
-        print(f"Error loading fixed genres: {str(e)}")
-        return pd.DataFrame(columns=['id', 'genres'])
\ No newline at end of file
+    Args:
+        path (str): Path to the source CSV file
+        use_snapshot (bool): Read/write the columnar snapshot keyed by the source hash
+
+    Returns:
+        DataFrame with one row per artist x track in the dtypes of :func:`compact_frame`;
+        ``df.attrs['version']`` holds the source fingerprint
+    """
+    fingerprint = file_fingerprint(path)
+    snapshot = _snapshot_path(path, fingerprint)
+
+    df = _read_snapshot(snapshot) if use_snapshot else None
+    if df is None:
+        df = _read_csv(path)
+        if use_snapshot:
+            _write_snapshot(df, snapshot)
+
+    df.attrs['version'] = fingerprint
+    return df
+
+def build_genre_fixes(source):
+    """
+    Build the id -> genres index used to backfill missing genres.
+
+    Args:
+        source (DataFrame): Frame with ``id`` and ``genres`` columns
+
+    Returns:
+        Series indexed by track id holding the first non-empty genre list per id
+    """
+    has_genres = source['genres'].str.len() > 0
+    return source.loc[has_genres, ['id', 'genres']].drop_duplicates('id').set_index('id')['genres']
+
+def apply_genre_fixes(df, fixes):
+    """Fill empty ``genres`` lists in ``df`` in place from a :func:`build_genre_fixes` index."""
+    missing = df['genres'].str.len() == 0
+    # Mapped as plain values; lists cannot become the categories of a categorical
+    updates = df.loc[missing, 'id'].astype(object).map(fixes).dropna()
+    df.loc[updates.index, 'genres'] = updates
+    return len(updates)
+
+class GenreIndex:
+    """
+    Interned genre vocabulary laid out CSR-style over the rows of a frame.
+
+    The genres of row ``i`` are ``vocabulary[codes[offsets[i]:offsets[i + 1]]]`` and
+    ``row_map[j]`` is the row owning ``codes[j]``, i.e. the row order of
+    ``df.explode('genres')`` without materialising it.
+    """
+
+    def __init__(self, vocabulary, offsets, codes):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.codes = codes
+        self.row_map = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    @classmethod
+    def from_lists(cls, genres):
+        lengths = genres.str.len().fillna(0).to_numpy(dtype=np.int64)
+        flat = pd.Series(list(itertools.chain.from_iterable(genres)), dtype=object)
+        codes, vocabulary = pd.factorize(flat)
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(pd.Index(vocabulary, dtype=object), offsets, codes.astype(np.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _entries(self, row_mask=None):
+        if row_mask is None:
+            return self.row_map, self.codes
+        keep = np.asarray(row_mask, dtype=bool)[self.row_map]
+        return self.row_map[keep], self.codes[keep]
+
+    def counts(self, row_mask=None):
+        """
+        Count rows per genre, most frequent first.
+
+        Args:
+            row_mask (array-like): Optional boolean mask restricting the rows counted
+
+        Returns:
+            Series of counts indexed by genre name, without zero counts
+        """
+        _, codes = self._entries(row_mask)
+        counts = pd.Series(np.bincount(codes, minlength=len(self.vocabulary)), index=self.vocabulary)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+    def top(self, n, row_mask=None):
+        return self.counts(row_mask).head(n).index.tolist()
+
+    def explode(self, df, columns, genres=None, row_mask=None):
+        """
+        Equivalent of ``df[columns].explode('genres')`` driven by the index.
+
+        Args:
+            df (DataFrame): The frame this index was built from
+            columns (list): Columns to carry over from ``df``
+            genres (list): Optional genres to keep; they also become the category order
+            row_mask (array-like): Optional boolean mask of rows to keep
+
+        Returns:
+            DataFrame with the selected columns plus a categorical ``genres`` column,
+            one row per (row, genre) pair, indexed like ``df``
+        """
+        rows, codes = self._entries(row_mask)
+        categories = self.vocabulary
+        if genres is not None:
+            categories = pd.Index(genres, dtype=object)
+            lookup = np.full(len(self.vocabulary), -1, dtype=np.int32)
+            known = self.vocabulary.get_indexer(categories)
+            lookup[known[known >= 0]] = np.arange(len(categories), dtype=np.int32)[known >= 0]
+            codes = lookup[codes]
+            rows, codes = rows[codes >= 0], codes[codes >= 0]
+
+        exploded = df[columns].take(rows)
+        exploded['genres'] = pd.Categorical.from_codes(codes, categories=categories)
+        return exploded
+
+    def first_genre(self, default='Unknown'):
+        """Return the first listed genre of every row as an array, ``default`` when empty."""
+        has_genres = self.offsets[1:] > self.offsets[:-1]
+        first = np.full(len(self), default, dtype=object)
+        first[has_genres] = self.vocabulary.to_numpy()[self.codes[self.offsets[:-1][has_genres]]]
+        return first
+
+# Tables derived from a loaded frame, keyed by the frame's identity and dropped with it
+_derived = {}
+_derived_lock = threading.Lock()
+# (frame id, table name) -> lock held while that table is being built
+_building = {}
+
+def derived(df, name, build):
+    """
+    Compute ``build(df)`` once per frame and reuse it for later calls.
+
+    Concurrent callers asking for the same table wait for a single build.
+
+    Args:
+        df (DataFrame): Frame the table is derived from
+        name (str): Name of the derived table
+        build (callable): Function building the table from ``df``
+
+    Returns:
+        The cached or freshly built table
+    """
+    key = id(df)
+    with _derived_lock:
+        tables = _derived.get(key)
+        if tables is None:
+            tables = _derived[key] = {}
+            weakref.finalize(df, _derived.pop, key, None)
+        if name in tables:
+            return tables[name]
+        build_lock = _building.setdefault((key, name), threading.Lock())
+
+    with build_lock:
+        with _derived_lock:
+            if name in tables:
+                return tables[name]
+        table = build(df)
+        with _derived_lock:
+            tables[name] = table
+            _building.pop((key, name), None)
+    return table
+
+def genre_index(df):
+    """Return the :class:`GenreIndex` of ``df``, built on first use."""
+    return derived(df, 'genre_index', lambda frame: GenreIndex.from_lists(frame['genres']))
+
+def load_prepared_data(path=DEFAULT_DATA_PATH, fixes_path=DEFAULT_GENRE_FIXES_PATH, use_snapshot=True):
+    """
+    Load the dataset with missing genres backfilled, as served by the dashboard.
+
+    The repaired frame is snapshotted under a key covering both the source and the
+    fixes file, so warm starts read a single Parquet file and skip the repair.
+
+    Args:
+        path (str): Path to the source CSV file
+        fixes_path (str): Optional CSV whose genres backfill empty rows; when omitted
+            the source backfills itself from other rows of the same track
+        use_snapshot (bool): Read/write columnar snapshots
+
+    Returns:
+        Prepared DataFrame; ``df.attrs['version']`` identifies source and fixes
+    """
+    version = file_fingerprint(path)
+    if fixes_path:
+        version = f"{version}-{file_fingerprint(fixes_path)}"
+    snapshot = _snapshot_path(path, version, stage='prepared', fixes_path=fixes_path)
+
+    df = _read_snapshot(snapshot) if use_snapshot else None
+    if df is None:
+        df = load_data(path, use_snapshot=use_snapshot)
+        try:
+            fixes_source = load_data(fixes_path, use_snapshot=use_snapshot) if fixes_path else df
+            updated = apply_genre_fixes(df, build_genre_fixes(fixes_source))
+            print(f"Backfilled genres for {updated} rows")
+        except Exception as e:
+            print(f"Warning: Error updating genres: {str(e)}")
+            print("Continuing with original genres...")
+        if use_snapshot:
+            _write_snapshot(df, snapshot)
+
+    df.attrs['version'] = version
+    genre_index(df)
+    return df
+
+if __name__ == '__main__':
+    # Offline build step: python -m utils.data_loader [--source ...] [--fixes ...]
+    parser = argparse.ArgumentParser(description='Build the prepared dataset snapshot served by the dashboard.')
+    parser.add_argument('--source', default=DEFAULT_DATA_PATH, help='Source CSV file')
+    parser.add_argument('--fixes', default=DEFAULT_GENRE_FIXES_PATH, help='Optional CSV used to backfill missing genres')
+    args = parser.parse_args()
+
+    prepared = load_prepared_data(args.source, args.fixes)
+    print(f"Prepared {len(prepared)} rows (version {prepared.attrs['version']}) in {SNAPSHOT_DIR}")
@@ -0,0 +1,153 @@
+"""The dataset served by the dashboard, reloaded in the background when its source changes."""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from utils import metrics
+from utils.aggregates import popularity_cube
+from utils.caching import frame_fingerprint
+from utils.data_loader import DEFAULT_DATA_PATH, DEFAULT_GENRE_FIXES_PATH, load_prepared_data
+
+# Seconds between checks of the source files; 0 disables hot-reloading
+RELOAD_INTERVAL_SECONDS = float(os.getenv('DATA_RELOAD_INTERVAL', 30))
+
+# frame: prepared DataFrame; version: df.attrs['version']; loaded_at: time.time() of the load
+Dataset = namedtuple('Dataset', ['frame', 'version', 'loaded_at'])
+
+_current = None
+_sources = (DEFAULT_DATA_PATH, DEFAULT_GENRE_FIXES_PATH)
+_source_state = None
+_reload_lock = threading.Lock()
+_watcher = None
+# Called with the new dataset before it goes live, then with (new, old) once it has
+_warm_hooks = []
+_swap_hooks = []
+
+def _stat_sources(paths):
+    # Cheap change detection; the content hash taken while loading decides whether it really changed
+    state = []
+    for path in paths:
+        if path:
+            stat = os.stat(path)
+            state.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(state)
+
+def _load(path, fixes_path):
+    state = _stat_sources((path, fixes_path))
+    started = time.perf_counter()
+    df = load_prepared_data(path, fixes_path)
+    # Build the shared derived tables now rather than inside the first request
+    popularity_cube(df)
+    frame_fingerprint(df)
+    dataset = Dataset(df, df.attrs['version'], time.time())
+    seconds = time.perf_counter() - started
+    print(f"Loaded dataset version {dataset.version} ({len(df)} rows) in {seconds:.2f}s")
+    return dataset, state, seconds
+
+def load_dataset(path=DEFAULT_DATA_PATH, fixes_path=DEFAULT_GENRE_FIXES_PATH):
+    """
+    Load the dataset and make it current.
+
+    Args:
+        path (str): Source CSV file, also watched for changes
+        fixes_path (str): Optional genre fixes CSV, also watched
+
+    Returns:
+        The loaded :data:`Dataset`
+    """
+    global _current, _sources, _source_state
+    with _reload_lock:
+        dataset, state, seconds = _load(path, fixes_path)
+        _current, _sources, _source_state = dataset, (path, fixes_path), state
+    metrics.record_dataset_load(seconds, dataset.version, len(dataset.frame))
+    return dataset
+
+def current_dataset():
+    """
+    Return the live dataset.
+
+    Requests should call this once and keep the result, so every chart of a
+    page is drawn from the same version even if a reload lands midway.
+    """
+    if _current is None:
+        return load_dataset()
+    return _current
+
+def on_warm(hook):
+    """Register ``hook(dataset)``, run on a freshly loaded dataset before it is swapped in."""
+    _warm_hooks.append(hook)
+    return hook
+
+def on_swap(hook):
+    """Register ``hook(new, old)``, run after a reload to drop state tied to the old version."""
+    _swap_hooks.append(hook)
+    return hook
+
+def reload_if_changed():
+    """
+    Reload the dataset if its source files changed since the last load.
+
+    The new frame is loaded and warmed while the old one keeps serving, then
+    swapped in with a single assignment.
+
+    Returns:
+        True when a new version went live
+    """
+    global _current, _source_state
+    with _reload_lock:
+        state = _stat_sources(_sources)
+        if state == _source_state:
+            return False
+        dataset, state, seconds = _load(*_sources)
+        _source_state = state
+        old = _current
+        if old is not None and dataset.version == old.version:
+            # Touched but not modified
+            return False
+
+        for hook in _warm_hooks:
+            try:
+                hook(dataset)
+            except Exception as e:
+                print(f"Warning: warming dataset {dataset.version} failed: {str(e)}")
+
+        _current = dataset
+        print(f"Dataset reloaded: version {dataset.version} ({len(dataset.frame)} rows)")
+        metrics.record_dataset_load(seconds, dataset.version, len(dataset.frame))
+
+    if old is not None:
+        for hook in _swap_hooks:
+            try:
+                hook(dataset, old)
+            except Exception as e:
+                print(f"Warning: cleanup after reload failed: {str(e)}")
+    return True
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reload_if_changed()
+        except Exception as e:
+            # A half-written export fails to parse; the next poll retries
+            print(f"Warning: dataset reload failed: {str(e)}")
+
+def start_watcher(interval=RELOAD_INTERVAL_SECONDS):
+    """
+    Poll the source files from a daemon thread and reload them when they change.
+
+    Args:
+        interval (float): Seconds between polls; 0 or less disables the watcher
+
+    Returns:
+        The watcher thread, or None when disabled
+    """
+    global _watcher
+    if interval <= 0:
+        return None
+    if _watcher is None or not _watcher.is_alive():
+        _watcher = threading.Thread(target=_watch, args=(interval,), name='dataset-watcher', daemon=True)
+        _watcher.start()
+    return _watcher
@@ -0,0 +1,238 @@
+"""Rate limiting, retries, checkpoints and counters for fetching data from the Spotify API."""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import requests
+from spotipy.exceptions import SpotifyException
+
+# Sustained request rate and burst allowed towards the API
+REQUESTS_PER_SECOND = float(os.getenv('SPOTIFY_RATE_LIMIT', 5))
+RATE_BURST = int(os.getenv('SPOTIFY_RATE_BURST', 10))
+# Attempts after the first one before a request is given up
+MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', 5))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Longest Retry-After honoured; longer server requests are cut down to this
+MAX_RETRY_AFTER_SECONDS = float(os.getenv('SPOTIFY_MAX_RETRY_AFTER', BACKOFF_MAX_SECONDS))
+
+# Progress of an interrupted run, so the next one only fetches what is missing
+CHECKPOINT_PATH = os.getenv('INGEST_CHECKPOINT_PATH', os.path.join('data', '.cache', 'ingest_checkpoint.json'))
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` saved up.
+
+    ``pause`` empties the bucket for a while, so a Retry-After from one request
+    holds back every thread sharing the bucket.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=RATE_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._updated - now, 0) + (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            # Refilling restarts once the pause is over
+            self._tokens = min(self._tokens, 0)
+            self._updated = max(self._updated, now + seconds)
+
+class IngestionStats:
+    """Counters and latencies of the requests made during one run."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.throttled = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            if not ok:
+                self.failures += 1
+
+    def record_retry(self, throttled=False):
+        with self._lock:
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+
+    def snapshot(self):
+        """
+        Return the counters of the run so far.
+
+        Returns:
+            dict with requests, failures, retries, throttled, elapsed_seconds,
+            requests_per_second and p50/p95/max latency in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.monotonic() - self.started
+
+            def percentile(q):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'elapsed_seconds': elapsed,
+                'requests_per_second': self.requests / elapsed if elapsed > 0 else 0.0,
+                'p50_ms': percentile(0.50),
+                'p95_ms': percentile(0.95),
+                'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            }
+
+    def summary(self):
+        s = self.snapshot()
+        return (f"{s['requests']} requests in {s['elapsed_seconds']:.1f}s ({s['requests_per_second']:.1f}/s), "
+                f"{s['retries']} retries ({s['throttled']} throttled), {s['failures']} failed, "
+                f"latency p50 {s['p50_ms']:.0f}ms p95 {s['p95_ms']:.0f}ms max {s['max_ms']:.0f}ms")
+
+def _retry_after(error):
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        seconds = float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+    # HTTP-dates, negative and non-finite values fall back to exponential backoff
+    return seconds if math.isfinite(seconds) and seconds >= 0 else None
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number ``attempt`` (starting at 0).
+
+    A server-provided Retry-After wins, up to MAX_RETRY_AFTER_SECONDS; otherwise
+    the delay doubles with each attempt, with full jitter so concurrent workers
+    do not retry in lockstep.
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def _describe(error):
+    if isinstance(error, SpotifyException):
+        return f"HTTP {error.http_status}"
+    return type(error).__name__
+
+def _is_retryable(error):
+    if isinstance(error, SpotifyException):
+        return error.http_status == 429 or error.http_status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+class Scheduler:
+    """
+    Issue API calls through a shared rate limiter with retries.
+
+    Rate limiting (429) and server errors are retried up to ``max_retries``
+    times, waiting for Retry-After when the API sends one and backing off
+    exponentially otherwise. Other errors are raised immediately.
+    """
+
+    def __init__(self, bucket=None, max_retries=MAX_RETRIES, stats=None, sleep=time.sleep):
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self.stats = stats or IngestionStats()
+        self._sleep = sleep
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.stats.record(time.monotonic() - started, ok=False)
+                if not _is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                throttled = isinstance(e, SpotifyException) and e.http_status == 429
+                delay = backoff_delay(attempt, _retry_after(e))
+                self.stats.record_retry(throttled)
+                if throttled:
+                    self.bucket.pause(delay)
+                print(f"Warning: request failed ({_describe(e)}), retry {attempt + 1} of {self.max_retries} in {delay:.1f}s")
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self.stats.record(time.monotonic() - started)
+            return result
+
+class Checkpoint:
+    """
+    JSON file of progress markers, saved after every step.
+
+    Entries are grouped in sections (e.g. ``pages``) and should stay small, such
+    as offsets; the fetched data itself belongs in the output. ``clear`` removes
+    the file once a run completes.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, section, key, default=None):
+        with self._lock:
+            return self._data.get(section, {}).get(key, default)
+
+    def put(self, section, key, value):
+        with self._lock:
+            self._data.setdefault(section, {})[key] = value
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename so a crash mid-write keeps the previous checkpoint
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
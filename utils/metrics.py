@@ -0,0 +1,174 @@
+"""Request, chart and cache instrumentation, exposed in the Prometheus text format."""
+
+import math
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# One chart build: wall and CPU seconds, payload size, 'ok'/'error' and the plot cache result
+ChartTiming = namedtuple('ChartTiming', ['wall', 'cpu', 'payload_bytes', 'outcome', 'cache'])
+
+_lock = threading.Lock()
+# (metric name, sorted label items) -> value
+_counters = defaultdict(float)
+_gauges = {}
+# (metric name, sorted label items) -> [bucket counts..., +Inf count, sum]
+_histograms = {}
+
+_HELP = {
+    'dashboard_chart_builds_total': ('counter', 'Chart builds by outcome and plot cache result'),
+    'dashboard_chart_timeouts_total': ('counter', 'Charts replaced by a placeholder after missing their budget'),
+    'dashboard_chart_wall_seconds': ('histogram', 'Wall time of chart builds'),
+    'dashboard_chart_cpu_seconds_total': ('counter', 'CPU time of chart builds (thread time)'),
+    'dashboard_chart_payload_bytes_total': ('counter', 'Bytes of figure output produced by chart builds'),
+    'dashboard_chart_payload_bytes': ('gauge', 'Bytes of the latest figure output of each chart'),
+    'dashboard_requests_total': ('counter', 'HTTP requests by route, status and page cache result'),
+    'dashboard_request_seconds': ('histogram', 'Time to produce responses'),
+    'dashboard_dataset_load_seconds': ('gauge', 'Time taken by the latest dataset load'),
+    'dashboard_dataset_rows': ('gauge', 'Rows in the live dataset'),
+    'dashboard_dataset_loaded_timestamp_seconds': ('gauge', 'Unix time the live dataset was loaded'),
+    'dashboard_dataset_info': ('gauge', 'Version of the live dataset'),
+    'dashboard_plot_cache_events_total': ('counter', 'Plot cache hits, misses, evictions and errors'),
+    'dashboard_plot_cache_entries': ('gauge', 'Plots held in the in-process cache'),
+    'dashboard_plot_cache_bytes': ('gauge', 'Approximate memory held by the in-process plot cache'),
+    'dashboard_page_cache_events_total': ('counter', 'Page cache hits and misses'),
+    'dashboard_page_cache_entries': ('gauge', 'Rendered pages held in memory'),
+}
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += value
+
+def record_chart(name, timing):
+    """Account one chart build described by a :data:`ChartTiming`."""
+    inc('dashboard_chart_builds_total', chart=name, outcome=timing.outcome, cache=timing.cache or 'none')
+    observe('dashboard_chart_wall_seconds', timing.wall, chart=name)
+    inc('dashboard_chart_cpu_seconds_total', timing.cpu, chart=name)
+    if timing.payload_bytes is not None:
+        inc('dashboard_chart_payload_bytes_total', timing.payload_bytes, chart=name)
+        set_gauge('dashboard_chart_payload_bytes', timing.payload_bytes, chart=name)
+
+def record_dataset_load(seconds, version, rows):
+    with _lock:
+        # Only the live version is reported
+        for key in [k for k in _gauges if k[0] == 'dashboard_dataset_info']:
+            del _gauges[key]
+    set_gauge('dashboard_dataset_load_seconds', seconds)
+    set_gauge('dashboard_dataset_rows', rows)
+    set_gauge('dashboard_dataset_loaded_timestamp_seconds', time.time())
+    set_gauge('dashboard_dataset_info', 1, version=version)
+
+def server_timing(entries):
+    """
+    Format a Server-Timing header value.
+
+    Args:
+        entries (iterable): (name, seconds or None, description or None) tuples
+
+    Returns:
+        Header value, e.g. ``chart-genre_distribution;dur=12.3;desc="miss"``
+    """
+    parts = []
+    for name, seconds, description in entries:
+        part = name
+        if seconds is not None:
+            part += f";dur={seconds * 1000:.1f}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ', '.join(parts)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(items, extra=()):
+    items = tuple(items) + tuple(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+def _collect_caches(page_cache):
+    # Cache counters live with the caches; they are copied in at scrape time
+    from utils.caching import cache_stats
+
+    stats = cache_stats()
+    counters = {}
+    for event in ('hits', 'shared_hits', 'misses', 'evictions', 'expirations', 'shared_errors'):
+        counters[_key('dashboard_plot_cache_events_total', {'event': event})] = stats[event]
+    gauges = {
+        _key('dashboard_plot_cache_entries', None): stats['entries'],
+        _key('dashboard_plot_cache_bytes', None): stats['bytes'],
+    }
+    if page_cache is not None:
+        page_stats = page_cache.stats()
+        for event in ('hits', 'misses'):
+            counters[_key('dashboard_page_cache_events_total', {'event': event})] = page_stats[event]
+        gauges[_key('dashboard_page_cache_entries', None)] = page_stats['entries']
+    return counters, gauges
+
+def render(page_cache=None):
+    """
+    Return every metric of this process in the Prometheus text exposition format.
+
+    Args:
+        page_cache (PageCache): Page cache whose counters are included, if any
+
+    Returns:
+        str ready to serve from /metrics
+    """
+    cache_counters, cache_gauges = _collect_caches(page_cache)
+    with _lock:
+        counters = dict(_counters)
+        counters.update(cache_counters)
+        gauges = dict(_gauges)
+        gauges.update(cache_gauges)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    # Workers keep their own counters, so every series says which process it came from
+    process = (('pid', os.getpid()),)
+    series = defaultdict(list)
+    for (name, labels), value in sorted(list(counters.items()) + list(gauges.items())):
+        series[name].append(f"{name}{_labels(labels, process)} {_number(value)}")
+    for (name, labels), values in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), values):
+            series[name].append(f"{name}_bucket{_labels(labels, process + (('le', _number(float(bound))),))} {count}")
+        series[name].append(f"{name}_sum{_labels(labels, process)} {_number(values[-1])}")
+        series[name].append(f"{name}_count{_labels(labels, process)} {values[len(LATENCY_BUCKETS)]}")
+
+    lines = []
+    for name in sorted(series):
+        kind, description = _HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(series[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,150 @@
+"""Whole-page response caching for the dashboard."""
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Rendered pages kept in memory, each with its compressed variants
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 256))
+
+# Popularity filters are snapped to multiples of this step, so nearby slider
+# positions share one rendered page
+PAGE_CACHE_STEP = float(os.getenv('PAGE_CACHE_STEP', 1))
+
+def quantize_range(popularity_range, step=PAGE_CACHE_STEP):
+    """
+    Snap a popularity range to the cache grid.
+
+    Args:
+        popularity_range (tuple): Requested (min, max) popularity
+        step (float): Grid spacing; 0 or less leaves the range unchanged
+
+    Returns:
+        Tuple of (min, max) clamped to 0-100
+    """
+    # Clamped before rounding too, so infinite bounds cannot overflow round()
+    low, high = (min(max(value, 0), 100) for value in popularity_range)
+    if step > 0:
+        low = round(low / step) * step
+        high = round(high / step) * step
+    low = min(max(low, 0), 100)
+    high = min(max(high, 0), 100)
+    # 20 and 20.0 must key and render identically
+    return (int(low) if float(low).is_integer() else low,
+            int(high) if float(high).is_integer() else high)
+
+def page_key(*parts):
+    """
+    Derive a stable page key (and ETag base) from everything the page depends on.
+
+    Args:
+        *parts: Dataset version, normalized query and rendering settings
+
+    Returns:
+        Hex digest identifying the rendered page
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+def negotiate_encoding(accept_encodings):
+    """
+    Pick the content coding to answer with.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        'br', 'gzip' or 'identity'
+    """
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+class PageCache:
+    """
+    Bounded LRU of rendered pages keyed by :func:`page_key`.
+
+    The uncompressed body is stored on ``put``; each encoding is compressed on
+    first request and kept alongside, so repeat visits cost a dictionary lookup.
+    Entries may be tagged (e.g. with the dataset version) for :meth:`invalidate`.
+    """
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, encoding='identity'):
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            body = variants.get(encoding)
+            if body is not None:
+                return body
+            identity = variants['identity']
+
+        body = compress(identity, encoding)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][encoding] = body
+        return body
+
+    def put(self, key, html, encodings=(), tag=None):
+        """Store a rendered page, precompressing ``encodings``; returns the stored variants."""
+        variants = {'identity': html.encode('utf-8')}
+        for encoding in encodings:
+            # Compressing up front keeps even the first visit off the compressor
+            if encoding != 'br' or brotli is not None:
+                variants[encoding] = compress(variants['identity'], encoding)
+        with self._lock:
+            self._entries[key] = variants
+            self._tags[key] = tag
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._tags.pop(evicted, None)
+        return variants
+
+    def invalidate(self, tag):
+        """Drop every page stored with ``tag``; returns the number removed."""
+        with self._lock:
+            stale = [key for key, entry_tag in self._tags.items() if entry_tag == tag]
+            for key in stale:
+                del self._entries[key]
+                del self._tags[key]
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
@@ -0,0 +1,225 @@
+"""
+Streaming conversion of fetched track records into the dataset the dashboard loads.
+
+get_top_tracks.py writes one JSON track record per line (NDJSON) as it fetches;
+this module turns such a file, record by record, into the flattened
+artist x track CSV read by ``utils.data_loader``, so memory stays flat however
+large the export is:
+
+    python -m utils.pipeline data/top_500songs_detailed.ndjson data/top_500songs.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+
+# Columns of the flattened dataset, as produced by pd.json_normalize(record_path='artists',
+# meta_prefix='track_') plus the genre count
+COLUMNS = [
+    'artist_id', 'artist_name', 'genres', 'popularity', 'followers',
+    'track_track_id', 'track_track_name', 'track_popularity', 'track_duration_ms',
+    'track_explicit', 'track_release_date', 'track_album_name', 'track_spotify_url',
+    'num_genres'
+]
+
+class NdjsonWriter:
+    """
+    Append records to an NDJSON file as they are produced.
+
+    Lines go to a temporary file that replaces ``path`` only when the writer
+    is closed without an error, so an interrupted run keeps the previous export.
+
+    With ``resume``, the temporary file is ``<path>.partial`` and survives an
+    error; the next writer appends to it and lists the ``key`` of every record
+    already there in ``resumed_keys``.
+    """
+
+    def __init__(self, path, resume=False, key='track_id'):
+        self.path = path
+        self.resume = resume
+        self.key = key
+        self.count = 0
+        self.resumed_keys = set()
+        self._tmp_path = f"{path}.partial" if resume else f"{path}.{os.getpid()}.tmp"
+        self._file = None
+
+    def _read_partial(self):
+        # Keep complete lines only; a run killed mid-write may leave half a record
+        complete = 0
+        with open(self._tmp_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.resumed_keys.add(record.get(self.key))
+                self.count += 1
+                complete += len(line)
+        os.truncate(self._tmp_path, complete)
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.resume and os.path.exists(self._tmp_path):
+            self._read_partial()
+            self._file = open(self._tmp_path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write('\n')
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        elif not self.resume:
+            os.remove(self._tmp_path)
+        return False
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    # Decode the elements of a top-level JSON array one at a time
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer:
+                raise ValueError('Expected a JSON array of track records')
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+        elif buffer:
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield record
+                continue
+        if eof:
+            if started:
+                raise ValueError('Unterminated JSON array')
+            raise ValueError('Expected a JSON array of track records')
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+def iter_records(path):
+    """
+    Yield track records from an NDJSON file or a JSON array, one at a time.
+
+    Args:
+        path (str): ``.ndjson``/``.jsonl`` file, or a ``.json`` file holding a list
+            as written by earlier versions of get_top_tracks.py
+
+    Yields:
+        dict per track
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            yield from _iter_json_array(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _format_date(value):
+    # Full dates as DD-MM-YYYY like the existing dataset; year or month precision stays as is
+    if value and len(value) == 10 and value[4] == '-' and value[7] == '-':
+        return f"{value[8:10]}-{value[5:7]}-{value[0:4]}"
+    return value or ''
+
+def _cell(value):
+    return '' if value is None else value
+
+def flatten_track(record):
+    """
+    Turn one track record into one row per credited artist.
+
+    Args:
+        record (dict): Track as produced by ``get_track_details``
+
+    Returns:
+        list of rows, each a list of values in COLUMNS order
+    """
+    explicit = record.get('explicit')
+    track = [
+        _cell(record.get('track_id')),
+        _cell(record.get('track_name')),
+        _cell(record.get('popularity')),
+        _cell(record.get('duration_ms')),
+        '' if explicit is None else ('TRUE' if explicit else 'FALSE'),
+        _format_date(record.get('release_date')),
+        _cell(record.get('album_name')),
+        _cell(record.get('spotify_url')),
+    ]
+    rows = []
+    for artist in record.get('artists', []):
+        genres = list(artist.get('genres') or [])
+        rows.append([
+            _cell(artist.get('artist_id')),
+            _cell(artist.get('artist_name')),
+            repr(genres),
+            _cell(artist.get('popularity')),
+            _cell(artist.get('followers')),
+        ] + track + [len(genres)])
+    return rows
+
+def write_dataset(records, path):
+    """
+    Stream track records into the flattened CSV dataset.
+
+    Args:
+        records (iterable): Track records, consumed one at a time
+        path (str): Output CSV, replaced atomically once complete
+
+    Returns:
+        Tuple of (tracks, rows) written
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    tracks = rows = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for record in records:
+                flat = flatten_track(record)
+                writer.writerows(flat)
+                tracks += 1
+                rows += len(flat)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tracks, rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flatten fetched track records into the dashboard dataset CSV.')
+    parser.add_argument('source', help='NDJSON (or legacy JSON array) written by get_top_tracks.py')
+    parser.add_argument('output', help='CSV file to write, e.g. the DATA_PATH served by the dashboard')
+    args = parser.parse_args()
+
+    tracks, rows = write_dataset(iter_records(args.source), args.output)
+    print(f"Wrote {rows} artist x track rows for {tracks} tracks to {args.output}")
@@ -0,0 +1,283 @@
+"""
+Opt-in profiling of dashboard requests.
+
+On demand: when PROFILE_TOKEN is set, a request with ``profile=collapsed`` or
+``profile=pstats`` in its query string and the token in an ``X-Profile-Token``
+header (or a ``profile_token`` parameter) is run under a profiler and answered
+with the profile instead of the page:
+
+    curl -H "X-Profile-Token: $PROFILE_TOKEN" "localhost:8080/?profile=collapsed" > page.folded
+    flamegraph.pl page.folded > page.svg      # or open page.folded in speedscope
+    curl -H "X-Profile-Token: $PROFILE_TOKEN" "localhost:8080/?profile=pstats" > page.pstats
+    snakeviz page.pstats                      # or python -m pstats page.pstats
+
+``collapsed`` samples the stacks of every thread working on the request,
+chart builders on the pool included; ``pstats`` traces every call with
+cProfile. Both skip the page and plot caches so the profile shows a full
+render, unless ``cached=1`` is given.
+
+Always on: PROFILE_SAMPLE_RATE of all requests are sampled and the collapsed
+stacks of the PROFILE_KEEP slowest are kept in PROFILE_DIR.
+"""
+
+import cProfile
+import glob
+import hmac
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar, copy_context
+from urllib.parse import parse_qs
+
+# Secret that enables on-demand profiles; unset disables them
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+# Fraction of requests profiled in the background (e.g. 0.01); 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+# Number of slowest sampled requests whose profiles are kept, and where
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('data', '.cache', 'profiles'))
+# Milliseconds between two stack samples
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+
+MODES = ('collapsed', 'pstats')
+
+_session = ContextVar('profile_session', default=None)
+
+def active():
+    """Return the profile session of the current request, if it is being profiled."""
+    return _session.get()
+
+def bypass_caches():
+    """Whether the current request asked to be profiled without the page and plot caches."""
+    session = _session.get()
+    return session is not None and session.bypass_caches
+
+def propagate(func):
+    """
+    Wrap ``func`` to run on another thread as part of the current request's profile.
+
+    Args:
+        func (callable): Work handed to a thread pool on behalf of this request
+
+    Returns:
+        ``func`` itself when the request is not being profiled
+    """
+    session = _session.get()
+    if session is None:
+        return func
+    # Each submission needs its own copy; a context cannot be entered by two threads
+    context = copy_context()
+    return lambda *args, **kwargs: context.run(session.run, func, *args, **kwargs)
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def fold(frame, root):
+    """Return the stack ending at ``frame`` as one collapsed-stack line prefix, root first."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame).replace(';', ':'))
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+class ProfileSession:
+    """
+    Profile of one request across the threads that work on it.
+
+    In 'collapsed' mode a background thread samples the stacks of the
+    registered threads; in 'pstats' mode each registered thread runs under its
+    own cProfile profiler and the results are merged.
+    """
+
+    def __init__(self, mode='collapsed', bypass_caches=False, interval=PROFILE_INTERVAL_MS / 1000):
+        self.mode = mode
+        self.bypass_caches = bypass_caches
+        self.interval = interval
+        self.stacks = Counter()
+        self._threads = {}
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._request_profile = None
+
+    def start(self):
+        self._threads[threading.get_ident()] = 'request'
+        if self.mode == 'pstats':
+            self._request_profile = cProfile.Profile()
+            self._request_profile.enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._request_profile is not None:
+            self._request_profile.disable()
+            with self._lock:
+                self._profiles.append(self._request_profile)
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def run(self, func, *args, **kwargs):
+        """Call ``func`` on this thread, profiling it while the session is open."""
+        if self._stopped.is_set():
+            return func(*args, **kwargs)
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = threading.current_thread().name
+        profile = cProfile.Profile() if self.mode == 'pstats' else None
+        try:
+            if profile is None:
+                return func(*args, **kwargs)
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._threads.pop(ident, None)
+                if profile is not None and not self._stopped.is_set():
+                    self._profiles.append(profile)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads.items())
+            for ident, role in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[fold(frame, role)] += 1
+
+    def collapsed(self):
+        """Samples in the collapsed-stack format read by flamegraph.pl, speedscope and inferno."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def pstats_bytes(self):
+        """Merged cProfile statistics, as written by ``pstats.Stats.dump_stats``."""
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        return marshal.dumps(stats.stats)
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware serving on-demand profiles and keeping those of the slowest sampled requests.
+
+    Args:
+        app: WSGI application to wrap
+        token (str): Secret required for on-demand profiles; empty disables them
+        sample_rate (float): Fraction of other requests profiled in the background
+        keep (int): Number of slowest sampled profiles kept in ``directory``
+        directory (str): Where sampled profiles are written
+        interval (float): Seconds between stack samples
+    """
+
+    def __init__(self, app, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE, keep=PROFILE_KEEP,
+                 directory=PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if 'profile' in query and self._authorized(environ, query):
+            return self._on_demand(environ, start_response, query)
+        if self.sample_rate and self.keep > 0 and random.random() < self.sample_rate:
+            return self._sampled(environ, start_response)
+        return self.app(environ, start_response)
+
+    def _authorized(self, environ, query):
+        if not self.token:
+            return False
+        supplied = environ.get('HTTP_X_PROFILE_TOKEN') or query.get('profile_token', [''])[0]
+        return hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
+
+    def _run(self, environ, session):
+        # Buffer the response so the profile covers producing the whole body
+        captured = {}
+        chunks = []
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'] = status, headers
+            return chunks.append
+
+        token = _session.set(session)
+        started = time.perf_counter()
+        session.start()
+        try:
+            iterable = self.app(environ, capture)
+            try:
+                chunks.extend(iterable)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            session.stop()
+            _session.reset(token)
+        return captured['status'], captured['headers'], b''.join(chunks), time.perf_counter() - started
+
+    def _on_demand(self, environ, start_response, query):
+        mode = query['profile'][0] or 'collapsed'
+        if mode not in MODES:
+            start_response('400 Bad Request', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [f"Unknown profile mode {mode!r}; use one of {', '.join(MODES)}\n".encode('utf-8')]
+
+        session = ProfileSession(mode, query.get('cached', ['0'])[0] != '1', self.interval)
+        status, _, _, seconds = self._run(environ, session)
+        headers = [
+            ('Cache-Control', 'no-store'),
+            ('X-Profile-Seconds', f"{seconds:.3f}"),
+            ('X-Profiled-Status', status),
+        ]
+        if mode == 'pstats':
+            body = session.pstats_bytes()
+            headers += [('Content-Type', 'application/octet-stream'),
+                        ('Content-Disposition', 'attachment; filename="request.pstats"')]
+        else:
+            body = session.collapsed().encode('utf-8')
+            headers.append(('Content-Type', 'text/plain; charset=utf-8'))
+        start_response('200 OK', headers + [('Content-Length', str(len(body)))])
+        return [body]
+
+    def _sampled(self, environ, start_response):
+        session = ProfileSession('collapsed', False, self.interval)
+        status, headers, body, seconds = self._run(environ, session)
+        if session.stacks:
+            try:
+                self._keep(environ, seconds, session.collapsed())
+            except OSError as e:
+                print(f"Could not save request profile: {e}")
+        start_response(status, headers)
+        return [body]
+
+    def _keep(self, environ, seconds, collapsed):
+        # Zero-padded durations make name order slowest-last, across worker processes too
+        route = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '/')).strip('_') or 'index'
+        name = f"{int(seconds * 1000):08d}ms-{int(time.time())}-{os.getpid()}-{route}.folded"
+        pattern = os.path.join(self.directory, '*.folded')
+        with self._lock:
+            kept = sorted(os.path.basename(path) for path in glob.glob(pattern))
+            if len(kept) >= self.keep and name <= kept[-self.keep]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(collapsed)
+            os.replace(tmp_path, path)
+            for stale in sorted(glob.glob(pattern))[:-self.keep]:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
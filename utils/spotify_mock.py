@@ -0,0 +1,169 @@
+"""
+Local stand-in for the parts of the Spotify Web API used by get_top_tracks.py.
+
+Serves deterministic top tracks and artists and can inject latency, rate
+limiting (429 with Retry-After) and server errors, so the fetcher can be
+exercised without credentials or quota:
+
+    python -m utils.spotify_mock --port 8765 --throttle-every 25
+    SPOTIFY_API_PREFIX=http://127.0.0.1:8765/v1/ SPOTIFY_ACCESS_TOKEN=mock python get_top_tracks.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENRES = ['pop', 'rock', 'indie', 'hip hop', 'rap', 'r&b', 'edm', 'house', 'jazz', 'soul',
+          'folk', 'metal', 'punk', 'k-pop', 'latin', 'reggaeton', 'country', 'classical']
+
+def make_catalog(n_tracks=500, n_artists=300, seed=0):
+    """Build ``(tracks, artists)`` shaped like the API's track and artist objects."""
+    rng = random.Random(seed)
+    artists = {}
+    for i in range(n_artists):
+        artist_id = f"mockartist{i:06d}"
+        artists[artist_id] = {
+            'id': artist_id,
+            'name': f"Artist {i}",
+            'genres': rng.sample(GENRES, rng.randint(0, 3)),
+            'popularity': rng.randint(0, 100),
+            'followers': {'href': None, 'total': rng.randint(0, 5_000_000)},
+            'type': 'artist',
+        }
+    artist_ids = list(artists)
+    tracks = []
+    for i in range(n_tracks):
+        track_id = f"mocktrack{i:07d}"
+        credited = rng.sample(artist_ids, rng.choice([1, 1, 1, 2, 3]))
+        tracks.append({
+            'id': track_id,
+            'name': f"Track {i}",
+            'popularity': rng.randint(0, 100),
+            'duration_ms': rng.randint(90_000, 420_000),
+            'explicit': rng.random() < 0.3,
+            'album': {'name': f"Album {i // 10}", 'release_date': f"{rng.randint(1970, 2024)}-{rng.randint(1, 12):02d}-01"},
+            'artists': [{'id': a, 'name': artists[a]['name']} for a in credited],
+            'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"},
+        })
+    return tracks, artists
+
+class MockState:
+    """Catalog, fault injection settings and request counters shared by handler threads."""
+
+    def __init__(self, tracks, artists, latency=0.0, throttle_every=0, retry_after=1, error_rate=0.0, seed=0):
+        self.tracks = tracks
+        self.artists = artists
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.counts = {'requests': 0, 'throttled': 0, 'errors': 0, 'top_tracks': 0, 'artists': 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fault(self):
+        """Return (status, headers) of an injected failure for the next request, or None."""
+        with self._lock:
+            self.counts['requests'] += 1
+            if self.throttle_every and self.counts['requests'] % self.throttle_every == 0:
+                self.counts['throttled'] += 1
+                return 429, {'Retry-After': str(self.retry_after)}
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.counts['errors'] += 1
+                return 503, {}
+        return None
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip('/')
+
+            if path == '/stats':
+                with state._lock:
+                    return self._send(200, dict(state.counts))
+
+            if state.latency:
+                time.sleep(state.latency)
+            fault = state.fault()
+            if fault:
+                status, headers = fault
+                return self._send(status, {'error': {'status': status, 'message': 'Injected by mock'}}, headers)
+
+            if path == '/v1/me/top/tracks':
+                limit = int(query.get('limit', ['20'])[0])
+                offset = int(query.get('offset', ['0'])[0])
+                if limit > 50:
+                    return self._send(400, {'error': {'status': 400, 'message': 'Invalid limit'}})
+                with state._lock:
+                    state.counts['top_tracks'] += 1
+                items = state.tracks[offset:offset + limit]
+                return self._send(200, {'items': items, 'total': len(state.tracks), 'limit': limit, 'offset': offset})
+
+            if path == '/v1/artists':
+                ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+                if len(ids) > 50:
+                    return self._send(400, {'error': {'status': 400, 'message': 'Too many ids requested'}})
+                with state._lock:
+                    state.counts['artists'] += 1
+                return self._send(200, {'artists': [state.artists.get(i) for i in ids]})
+
+            if path.startswith('/v1/artists/'):
+                artist = state.artists.get(path.rsplit('/', 1)[1])
+                if artist is None:
+                    return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+                return self._send(200, artist)
+
+            return self._send(404, {'error': {'status': 404, 'message': 'Service not found'}})
+
+    return Handler
+
+def serve(port=8765, host='127.0.0.1', **options):
+    """Start the mock on a background thread and return the server; ``port=0`` picks a free port."""
+    tracks, artists = make_catalog(options.pop('tracks', 500), options.pop('artists', 300), options.get('seed', 0))
+    state = MockState(tracks, artists, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, name='spotify-mock', daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a mock of the Spotify Web API endpoints used by get_top_tracks.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tracks', type=int, default=500, help='Number of top tracks')
+    parser.add_argument('--artists', type=int, default=300, help='Number of distinct artists')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--throttle-every', type=int, default=0, help='Answer every Nth request with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.host, tracks=args.tracks, artists=args.artists, latency=args.latency,
+                   throttle_every=args.throttle_every, retry_after=args.retry_after,
+                   error_rate=args.error_rate, seed=args.seed)
+    print(f"Mock Spotify API on http://{args.host}:{server.server_address[1]}/v1/ (stats at /stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
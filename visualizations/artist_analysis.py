@@ -1,13 +1,19 @@
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
-from .plot_utils import apply_dark_theme, SPOTIFY_COLORS, QUALITATIVE_PALETTE
+from .plot_utils import apply_dark_theme, render_figure, SPOTIFY_COLORS, QUALITATIVE_PALETTE
 from utils.caching import cache_plot
+from utils.data_loader import genre_index, track_urls
 # my top 20 lesgoo
 @cache_plot(ttl_seconds=300)
-def most_frequent_artists(df: pd.DataFrame, top_n: int = 15) -> str:
+def most_frequent_artists(df: pd.DataFrame, top_n: int = 15, output: str = 'fragment') -> str:
     try:
        
-        artist_counts = df['artist_name'].value_counts().head(top_n)
+        # Counted on the codes; artists come in order of appearance so ties rank as with value_counts
+        codes, artists = pd.factorize(df['artist_name'])
+        artist_counts = pd.Series(
+            np.bincount(codes[codes >= 0], minlength=len(artists)), index=np.asarray(artists, dtype=object)
+        ).sort_values(ascending=False).head(top_n)
         fig = go.Figure()
         
         # Add bars
@@ -38,34 +44,27 @@ def most_frequent_artists(df: pd.DataFrame, top_n: int = 15) -> str:
         )
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
         
     except Exception as e:
         print(f"Error in most_frequent_artists: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading most frequent artists chart",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
+        raise
 
 @cache_plot(ttl_seconds=300)
-def artist_popularity_genre(df: pd.DataFrame) -> str:
+def artist_popularity_genre(df: pd.DataFrame, output: str = 'fragment') -> str:
     try:
         # Get artists with their track counts and mean popularity
-        artist_stats = df.groupby('artist_name').agg({
-            'artist_popularity': 'first',
-            'id': 'count',
-            'genres': 'first',
-            'spotify_url': lambda x: list(x)[0]  # Keep first spotify URL for each artist
-        }).reset_index()
-        
-        # Get main genre for each artist (first one listed)
-        artist_stats['main_genre'] = artist_stats['genres'].apply(
-            lambda x: x[0] if isinstance(x, list) and len(x) > 0 else 'Unknown'
+        artist_stats = df.groupby('artist_name', observed=True).agg(
+            artist_popularity=('artist_popularity', 'first'),
+            id=('id', 'count'),
+            first_track=('id', 'first')  # Link to the artist's first track
         )
+        artist_stats['spotify_url'] = track_urls(artist_stats['first_track'])
+        
+        # Get main genre for each artist (first one listed on the artist's first row)
+        first_genres = pd.Series(genre_index(df).first_genre(), index=df.index)
+        artist_stats['main_genre'] = first_genres.groupby(df['artist_name'], observed=True).first()
+        artist_stats = artist_stats.reset_index()
         
         # Get top genres for coloring
         top_genres = artist_stats['main_genre'].value_counts().head(7).index.tolist()
@@ -127,15 +126,8 @@ def artist_popularity_genre(df: pd.DataFrame) -> str:
         # Apply theme
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
         
     except Exception as e:
         print(f"Error in artist_popularity_genre: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading artist popularity/genre chart",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
\ No newline at end of file
+        raise
@@ -6,29 +6,30 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.caching import cache_plot
-from .plot_utils import apply_dark_theme, SPOTIFY_COLORS, QUALITATIVE_PALETTE
+from utils.aggregates import popularity_cube, top_k_per_group
+from utils.data_loader import genre_index, track_urls
+from .plot_utils import apply_dark_theme, as_text, render_figure, SPOTIFY_COLORS, QUALITATIVE_PALETTE
 
 @cache_plot(ttl_seconds=300)
-def duration_distribution(df):
+def duration_distribution(df, output='fragment'):
     try:
-        df = df.copy()
-        df['duration_min'] = df['duration_ms'] / (1000 * 60) # to minutes
+        duration_min = df['duration_ms'] / (1000 * 60) # to minutes, without copying the frame
         fig = go.Figure()
-        bins = np.histogram_bin_edges(df['duration_min'], bins=40)
-        counts, _ = np.histogram(df['duration_min'], bins=bins)
+        bins = np.histogram_bin_edges(duration_min, bins=40)
+        counts, _ = np.histogram(duration_min, bins=bins)
         bin_centers = (bins[:-1] + bins[1:]) / 2
         
-        # Get sample songs for each bin for hover info
-        hover_data = []
-        for i in range(len(bins)-1):
-            mask = (df['duration_min'] >= bins[i]) & (df['duration_min'] < bins[i+1])
-            bin_songs = df[mask].sort_values('popularity', ascending=False).head(3)
-            hover_data.append([
-                f"<b>{name}</b> by {artist}<br>"
-                f"<a href='{url}' target='_blank'>Open in Spotify</a>"
-                for name, artist, url in 
-                zip(bin_songs['name'], bin_songs['artist_name'], bin_songs['spotify_url'])
-            ])
+        # Assign bins in one pass; like np.histogram, the last bin includes its right edge
+        bin_ids = np.clip(np.digitize(duration_min, bins) - 1, 0, len(bins) - 2)
+        
+        # Get the 3 most popular songs of each bin for hover info with a single grouped sort
+        top = top_k_per_group(bin_ids, df['popularity'], 3)
+        samples = (
+            "<b>" + as_text(df['name'].iloc[top]) + "</b> by " + as_text(df['artist_name'].iloc[top]) +
+            "<br><a href='" + track_urls(df['id'].iloc[top]) + "' target='_blank'>Open in Spotify</a>"
+        )
+        samples_by_bin = samples.groupby(bin_ids[top], sort=False).agg(list)
+        hover_data = [samples_by_bin.get(i, []) for i in range(len(bins) - 1)]
         
         fig.add_trace(go.Bar(
             x=bin_centers,
@@ -48,7 +49,7 @@ def duration_distribution(df):
                 "<extra></extra>"
             )
         ))
-        mean_duration = df['duration_min'].mean() # mean song duration 
+        mean_duration = duration_min.mean() # mean song duration 
         fig.add_vline(
             x=mean_duration,
             line_dash="dash",
@@ -78,93 +79,138 @@ def duration_distribution(df):
         # Apply dark theme
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
     except Exception as e:
         print(f"Error in duration_distribution: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading duration distribution",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
+        raise
+
+# Send smoothed density curves on a fixed grid instead of every raw duration
+DURATION_DENSITY = os.getenv('DURATION_BY_GENRE_MODE', 'points') == 'density'
+DENSITY_GRID_POINTS = 120
+
+def _density_curves(values, groups, n_groups, grid):
+    """Gaussian KDE of ``values`` per group on ``grid``, via a binned histogram and convolution."""
+    step = grid[1] - grid[0]
+    bins = np.clip(np.rint((values - grid[0]) / step).astype(np.int64), 0, len(grid) - 1)
+    hist = np.bincount(groups * len(grid) + bins, minlength=n_groups * len(grid)).reshape(n_groups, len(grid))
+    
+    counts = np.bincount(groups, minlength=n_groups)
+    spread = pd.Series(values).groupby(groups).std().reindex(range(n_groups)).fillna(0).to_numpy()
+    curves = np.zeros((n_groups, len(grid)))
+    for g in range(n_groups):
+        # Scott's rule, never narrower than one grid step
+        bandwidth = max(1.06 * spread[g] * max(counts[g], 1) ** -0.2, step)
+        offsets = np.arange(-4 * bandwidth, 4 * bandwidth + step, step)
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+        start = (len(kernel) - 1) // 2
+        curves[g] = np.convolve(hist[g], kernel)[start:start + len(grid)]
+    return curves
 
 @cache_plot(ttl_seconds=300)
-def duration_by_genre(df, popularity_range: tuple[float, float] | None = None):
+def duration_by_genre(df, popularity_range: tuple[float, float] | None = None, output='fragment',
+                      density: bool = DURATION_DENSITY):
     try:
      
+        row_mask = None
         if popularity_range:
-            df = df[(df['popularity'] >= popularity_range[0]) & 
-                   (df['popularity'] <= popularity_range[1])]
-        df = df.copy()
-        df['duration_min'] = df['duration_ms'] / (1000 * 60)
-        def parse_genres(x):
-            if isinstance(x, str):
-                try:
-                    return eval(x) if x.startswith('[') else [x]
-                except:
-                    return [x]
-            elif isinstance(x, list):
-                return x
-            else:
-                return [str(x)]
-        
-        df = df.assign(genres=df['genres'].apply(parse_genres))
-        genre_counts = df.explode('genres')['genres'].value_counts()
-        top_genres = genre_counts.head(15).index.tolist()
-        
-        plot_data = df.explode('genres')
-        plot_data = plot_data[plot_data['genres'].isin(top_genres)]
+            row_mask = ((df['popularity'] >= popularity_range[0]) & 
+                        (df['popularity'] <= popularity_range[1])).to_numpy()
+        
+        top_genres = popularity_cube(df).top(15, popularity_range)
+        
+        plot_data = genre_index(df).explode(
+            df, ['id', 'name', 'artist_name', 'popularity', 'duration_ms'],
+            genres=top_genres, row_mask=row_mask
+        )
+        durations = (plot_data['duration_ms'] / (1000 * 60)).to_numpy()
+        genre_codes = plot_data['genres'].cat.codes.to_numpy().astype(np.int64)
+        
+        # All per-genre statistics in a single grouped pass
+        stats = pd.Series(durations).groupby(genre_codes).describe().reindex(range(len(top_genres)))
+        
+        # Hover samples: the 3 most popular tracks of each genre from one grouped sort
+        top = top_k_per_group(genre_codes, plot_data['popularity'], 3)
+        samples = (
+            "<b>" + as_text(plot_data['name'].iloc[top]) + "</b> by " +
+            as_text(plot_data['artist_name'].iloc[top]) +
+            pd.Series(durations[top], index=plot_data.index[top]).map(" ({:.1f} min)<br>".format) +
+            "<a href='" + track_urls(plot_data['id'].iloc[top]) + "' target='_blank'>Open in Spotify</a>"
+        )
+        sample_text = samples.groupby(genre_codes[top]).agg("<br>".join).reindex(range(len(top_genres)), fill_value='')
+        
+        # Durations grouped by genre with one sort instead of a boolean scan per genre
+        order = np.argsort(genre_codes, kind='stable')
+        bounds = np.searchsorted(genre_codes[order], np.arange(len(top_genres) + 1))
+        sorted_durations = durations[order]
+        
+        if density and len(durations):
+            grid = np.linspace(max(durations.min() - 0.5, 0), durations.max() + 0.5, DENSITY_GRID_POINTS)
+            curves = _density_curves(durations, genre_codes, len(top_genres), grid)
         
         fig = go.Figure()
         
         for i, genre in enumerate(top_genres):
-            genre_data = plot_data[plot_data['genres'] == genre]
-            stats = {
-                'median': genre_data['duration_min'].median(),
-                'q1': genre_data['duration_min'].quantile(0.25),
-                'q3': genre_data['duration_min'].quantile(0.75),
-                'count': len(genre_data)
-            }
-            sample_tracks = genre_data.sort_values('popularity', ascending=False).head(3)
-            sample_text = "<br>".join([
-                f"<b>{name}</b> by {artist} ({dur:.1f} min)<br>"
-                f"<a href='{url}' target='_blank'>Open in Spotify</a>"
-                for name, artist, dur, url in 
-                zip(sample_tracks['name'], sample_tracks['artist_name'], 
-                    sample_tracks['duration_min'], sample_tracks['spotify_url'])
-            ])
+            color = QUALITATIVE_PALETTE[i % len(QUALITATIVE_PALETTE)]
+            customdata = [[
+                genre,
+                stats['50%'][i],
+                stats['25%'][i],
+                stats['75%'][i],
+                int(stats['count'][i]),
+                sample_text[i]
+            ]]
+            hovertemplate = (
+                "<b>%{customdata[0]}</b><br>" +
+                "Median: %{customdata[1]:.1f} min<br>" +
+                "Q1-Q3: %{customdata[2]:.1f}-%{customdata[3]:.1f} min<br>" +
+                "Track count: %{customdata[4]}<br><br>" +
+                "Popular tracks in this genre:<br>%{customdata[5]}" +
+                "<extra></extra>"
+            )
+            
+            if density and len(durations):
+                # Ridgeline of the precomputed density, scaled like a width=2 one-sided violin
+                curve = np.round(i + curves[i] / max(curves[i].max(), 1e-12), 3)
+                fig.add_trace(go.Scatter(
+                    # Closed outline: along the curve, then back along the baseline
+                    x=np.concatenate([grid, [grid[-1], grid[0]]]).round(3),
+                    y=np.concatenate([curve, [i, i]]),
+                    fill='toself',
+                    mode='lines',
+                    fillcolor=color,
+                    line=dict(color=SPOTIFY_COLORS['light_gray'], width=1),
+                    opacity=0.7,
+                    hoverinfo='skip'
+                ))
+                # The median marker carries the hover details
+                fig.add_trace(go.Scatter(
+                    x=[stats['50%'][i]],
+                    y=[i],
+                    mode='markers',
+                    marker=dict(color=SPOTIFY_COLORS['white'], size=8, symbol='line-ns-open'),
+                    customdata=customdata,
+                    hovertemplate=hovertemplate
+                ))
+                continue
             
             fig.add_trace(go.Violin(
-                x=genre_data['duration_min'],
+                x=sorted_durations[bounds[i]:bounds[i + 1]],
                 name=genre,
                 orientation='h',
                 side='positive',
                 width=2,
                 points='outliers',
                 meanline=dict(visible=True, color=SPOTIFY_COLORS['white']),
-                fillcolor=QUALITATIVE_PALETTE[i % len(QUALITATIVE_PALETTE)],
+                fillcolor=color,
                 line=dict(color=SPOTIFY_COLORS['light_gray']),
                 opacity=0.7,
-                customdata=[[
-                    genre,
-                    stats['median'],
-                    stats['q1'],
-                    stats['q3'],
-                    stats['count'],
-                    sample_text
-                ]],
-                hovertemplate=(
-                    "<b>%{customdata[0]}</b><br>" +
-                    "Median: %{customdata[1]:.1f} min<br>" +
-                    "Q1-Q3: %{customdata[2]:.1f}-%{customdata[3]:.1f} min<br>" +
-                    "Track count: %{customdata[4]}<br><br>" +
-                    "Popular tracks in this genre:<br>%{customdata[5]}" +
-                    "<extra></extra>"
-                )
+                customdata=customdata,
+                hovertemplate=hovertemplate
             ))
         
+        if density:
+            fig.update_yaxes(tickmode='array', tickvals=list(range(len(top_genres))), ticktext=top_genres)
+        
         # Update layout
         fig.update_layout(
             title='Track Duration Distribution by Genre',
@@ -186,14 +232,7 @@ def duration_by_genre(df, popularity_range: tuple[float, float] | None = None):
         
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
     except Exception as e:
         print(f"Error in duration_by_genre: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading duration by genre distribution",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
\ No newline at end of file
+        raise
@@ -6,33 +6,78 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.caching import cache_plot
-from .plot_utils import apply_dark_theme, SPOTIFY_COLORS, QUALITATIVE_PALETTE
+from utils.aggregates import popularity_cube
+from utils.data_loader import derived, genre_index, track_urls
+from .plot_utils import apply_dark_theme, as_text, render_figure, SPOTIFY_COLORS, QUALITATIVE_PALETTE
 
 @cache_plot(ttl_seconds=300)
-def genre_cooccurrence_network(df: pd.DataFrame, top_n: int = 10) -> str:
+def genre_distribution(df: pd.DataFrame, popularity_range: tuple[float, float] | None = None, top_n: int = 20, output: str = 'fragment') -> str:
+    try:
+        # Answered from per-popularity prefix sums, so slider moves never rescan the rows
+        cube = popularity_cube(df)
+        genre_stats = cube.summary(popularity_range, top_n)
+        # Tracks list several genres, so shares are of filtered tracks and may exceed 100% in sum
+        total = cube.track_count(popularity_range)
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Bar(
+            x=genre_stats['count'],
+            y=genre_stats.index,
+            orientation='h',
+            marker_color=SPOTIFY_COLORS['green'],
+            opacity=0.8,
+            marker_line=dict(color=SPOTIFY_COLORS['light_gray'], width=1),
+            customdata=list(zip(
+                genre_stats['count'] / max(total, 1),
+                genre_stats['mean_popularity'],
+                genre_stats['mean_duration_ms'] / (1000 * 60)
+            )),
+            hovertemplate=(
+                "<b>%{y}</b><br>" +
+                "Tracks: %{x}<br>" +
+                "Share of tracks: %{customdata[0]:.1%}<br>" +
+                "Avg Popularity: %{customdata[1]:.1f}<br>" +
+                "Avg Duration: %{customdata[2]:.1f} min<br>" +
+                "<extra></extra>"
+            )
+        ))
+
+        fig.update_layout(
+            title='Top Genres',
+            xaxis_title='Number of Tracks',
+            yaxis_title=None,
+            height=600,
+            bargap=0.2,
+            showlegend=False,
+            yaxis=dict(autorange="reversed")  # Most common genre at the top
+        )
+        apply_dark_theme(fig)
+
+        return render_figure(fig, output)
+
+    except Exception as e:
+        print(f"Error in genre_distribution: {str(e)}")
+        raise
+
+
+@cache_plot(ttl_seconds=300)
+def genre_cooccurrence_network(df: pd.DataFrame, top_n: int = 10, output: str = 'fragment') -> str:
    
     import itertools
     import networkx as nx
     try:
-        def parse_genres(x):
-            if isinstance(x, str):
-                try:
-                    return eval(x) if x.startswith('[') else [x]
-                except:
-                    return [x]
-            elif isinstance(x, list):
-                return x
-            else:
-                return [str(x)]
-
         # Get top N genres
-        genres_series = df['genres'].apply(parse_genres)
-        all_genres = genres_series.explode().value_counts().head(top_n).index.tolist()
+        index = genre_index(df)
+        all_genres = index.top(top_n)
 
-        # Build co-occurrence matrix (per artist)
-        artist_genres = df.groupby('artist_name')['genres'].apply(lambda x: list(itertools.chain.from_iterable([parse_genres(g) for g in x]))).reset_index()
-        # Only keep top genres
-        artist_genres['genres'] = artist_genres['genres'].apply(lambda gs: [g for g in gs if g in all_genres])
+        # Build co-occurrence matrix (per artist), only keeping top genres
+        artist_genres = (
+            index.explode(df, ['artist_name'], genres=all_genres)
+            .groupby('artist_name', observed=True)['genres']
+            .agg(list)
+            .reset_index()
+        )
 
         # Count co-occurrences
         cooccurrence = {}
@@ -118,48 +163,51 @@ def genre_cooccurrence_network(df: pd.DataFrame, top_n: int = 10) -> str:
             xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
             yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)
         )
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
     except Exception as e:
         print(f"Error in genre_cooccurrence_network: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading genre co-occurrence network",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
+        raise
+
+
+def _build_year_genre_table(df, top_n):
+    index = genre_index(df)
+    top_genres = index.top(top_n)
+    plot_df = index.explode(df, ['release_year', 'popularity', 'id', 'name'], genres=top_genres)
+    
+    grouped = plot_df.groupby(['release_year', 'genres'], observed=True)
+    genre_years = grouped.agg(id=('popularity', 'size'), popularity=('popularity', 'mean'))
+    
+    # Sample tracks are the first three of each group, picked with one cumcount pass
+    samples = plot_df[grouped.cumcount().to_numpy() < 3]
+    sample_text = (
+        "• " + as_text(samples['name']) +
+        " (<a href='" + track_urls(samples['id']) + "' target='_blank'>Spotify</a>)"
+    )
+    genre_years['name'] = sample_text.groupby(
+        [samples['release_year'], samples['genres']], observed=True
+    ).agg('<br>'.join)
+    
+    return top_genres, genre_years.reset_index()
+
+def year_genre_table(df: pd.DataFrame, top_n: int = 8):
+    """
+    Return the top genres and their per-year aggregates, built once per frame.
+
+    Args:
+        df (DataFrame): Dataset
+        top_n (int): Number of most frequent genres to include
+
+    Returns:
+        Tuple of (top genre names, DataFrame with release_year, genres, id (track
+        count), popularity (mean) and name (sample track HTML) columns)
+    """
+    return derived(df, f'year_genre_table:{top_n}', lambda frame: _build_year_genre_table(frame, top_n))
 
 
 @cache_plot(ttl_seconds=300)
-def genre_evolution_by_year(df: pd.DataFrame, top_n: int = 8) -> str:
+def genre_evolution_by_year(df: pd.DataFrame, top_n: int = 8, output: str = 'fragment') -> str:
     try:
-        # Handle string representation of lists if they haven't been converted
-        def parse_genres(x):
-            if isinstance(x, str):
-                try:
-                    return eval(x) if x.startswith('[') else [x]
-                except:
-                    return [x]
-            elif isinstance(x, list):
-                return x
-            else:
-                return [str(x)]
-        
-        df = df.assign(genres=df['genres'].apply(parse_genres))
-      
-        top_genres = df['genres'].explode().value_counts().nlargest(top_n).index.tolist()
-        
-        plot_df = df.explode('genres')
-        plot_df = plot_df[plot_df['genres'].isin(top_genres)]
-        genre_years = plot_df.groupby(['release_year', 'genres']).agg({
-            'id': 'count',
-            'popularity': 'mean',
-            'name': lambda x: '<br>'.join(
-                f"• {name} (<a href='{url}' target='_blank'>Spotify</a>)"
-                for name, url in zip(x.head(3), plot_df.loc[x.index].head(3)['spotify_url'])
-            )
-        }).reset_index()
+        top_genres, genre_years = year_genre_table(df, top_n)
         
         # Create figure
         fig = go.Figure()
@@ -219,15 +267,8 @@ def genre_evolution_by_year(df: pd.DataFrame, top_n: int = 8) -> str:
         
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
         
     except Exception as e:
         print(f"Error in genre_evolution_by_year: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading genre evolution",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
\ No newline at end of file
+        raise
@@ -1,3 +1,7 @@
+import os
+
+import pandas as pd
+
 SPOTIFY_COLORS = {
     'green': '#1DB954',
     'black': '#191414',
@@ -11,6 +15,10 @@ SEQUENTIAL_PALETTE = ['#1DB954', '#1ed760', '#52eb80', '#86efa0', '#baf3c0']
 DIVERGING_PALETTE = ['#FF4632', '#FF8A80', '#FFBDAF', '#B3B3B3', '#90F0B3', '#52CD7C', '#1DB954']
 QUALITATIVE_PALETTE = ['#1DB954', '#FF4632', '#1E90FF', '#FFB100', '#E91E63', '#9C27B0', '#00BCD4']
 
+# 'json' emits compact figure specs hydrated by static/js/dashboard.js against a single
+# shared copy of plotly.js; 'html' keeps plotly's own fragments (still without the library)
+RENDER_MODE = os.getenv('PLOT_RENDER_MODE', 'json')
+
 def apply_dark_theme(fig):
     fig.update_layout(
         plot_bgcolor=SPOTIFY_COLORS['dark_gray'],
@@ -37,4 +45,22 @@ def apply_dark_theme(fig):
         zerolinecolor=SPOTIFY_COLORS['light_gray']
     )
     
-    return fig
\ No newline at end of file
+    return fig
+
+def as_text(values):
+    """String form of a column for hover text, expanding categoricals (e.g. names) first."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    return values.astype(str)
+
+# output='fragment' gives the HTML embedded in the page, output='json' the bare figure
+# spec served by the chart API
+def render_figure(fig, output='fragment'):
+    if output == 'json':
+        return fig.to_json()
+    if RENDER_MODE == 'html':
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+    # '</' is escaped so hover markup such as '</a>' can never terminate the script tag
+    spec = fig.to_json().replace('</', '<\\/')
+    return f'<div class="plotly-chart"><script type="application/json">{spec}</script></div>'
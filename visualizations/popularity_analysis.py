@@ -5,58 +5,116 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.caching import cache_plot
-from .plot_utils import apply_dark_theme, SPOTIFY_COLORS, SEQUENTIAL_PALETTE, DIVERGING_PALETTE
+from utils.aggregates import histogram_bins, top_k_per_group
+from utils.data_loader import track_urls
+from .plot_utils import apply_dark_theme, as_text, render_figure, SPOTIFY_COLORS, SEQUENTIAL_PALETTE, DIVERGING_PALETTE
+
+# Above this many tracks markers are drawn with WebGL instead of SVG
+SCATTER_WEBGL_THRESHOLD = int(os.getenv('SCATTER_WEBGL_THRESHOLD', 5000))
+# Above this many tracks the scatter becomes a 2-D histogram of popularity cells
+SCATTER_BINNED_THRESHOLD = int(os.getenv('SCATTER_BINNED_THRESHOLD', 100000))
+# Width of a popularity cell in binned mode, in popularity points
+SCATTER_BIN_SIZE = 2
+
+def _track_hover_text(df):
+    # Vectorized string building, only ever called for the rows actually drawn
+    return (
+        "Track: " + as_text(df['name']) + "<br>" +
+        "Artist: " + as_text(df['artist_name']) + "<br>" +
+        "Album: " + as_text(df['album_name']) + "<br>" +
+        "Artist Popularity: " + df['artist_popularity'].astype(str) + "<br>" +
+        "Track Popularity: " + df['popularity'].astype(str) + "<br>" +
+        "<a href='" + track_urls(df['id']) + "' target='_blank'>Open in Spotify</a>"
+    )
+
+def _binned_popularity_trace(df):
+    """Heatmap of track counts per (artist, track) popularity cell with the top track of each."""
+    n_bins = 100 // SCATTER_BIN_SIZE + 1
+    x_bins = np.clip(df['artist_popularity'].fillna(0).to_numpy() // SCATTER_BIN_SIZE, 0, n_bins - 1).astype(np.int64)
+    y_bins = np.clip(df['popularity'].fillna(0).to_numpy() // SCATTER_BIN_SIZE, 0, n_bins - 1).astype(np.int64)
+    cells = y_bins * n_bins + x_bins
+    counts = np.bincount(cells, minlength=n_bins * n_bins).reshape(n_bins, n_bins)
+    
+    # The most popular track of every occupied cell, chosen with one grouped sort
+    top = top_k_per_group(cells, df['popularity'], 1)
+    samples = np.full(n_bins * n_bins, '', dtype=object)
+    samples[cells[top]] = (
+        "Top track: " + as_text(df['name'].iloc[top]) + " by " + as_text(df['artist_name'].iloc[top]) +
+        "<br><a href='" + track_urls(df['id'].iloc[top]) + "' target='_blank'>Open in Spotify</a>"
+    ).to_numpy()
+    
+    centers = np.arange(n_bins) * SCATTER_BIN_SIZE + (SCATTER_BIN_SIZE - 1) / 2
+    return go.Heatmap(
+        x=centers,
+        y=centers,
+        z=np.where(counts > 0, counts, np.nan),
+        customdata=samples.reshape(n_bins, n_bins),
+        colorscale=SEQUENTIAL_PALETTE,
+        colorbar=dict(
+            title=dict(
+                text='Tracks',
+                side='right'
+            ),
+            thickness=15,
+            len=0.7,
+            bgcolor='rgba(0,0,0,0)'
+        ),
+        name='Artists',
+        hovertemplate=(
+            "Artist Popularity: ~%{x}<br>" +
+            "Track Popularity: ~%{y}<br>" +
+            "Tracks: %{z}<br>%{customdata}<extra></extra>"
+        )
+    )
 
 @cache_plot(ttl_seconds=300)
-def artist_vs_track_popularity(df):
+def artist_vs_track_popularity(df, output='fragment', mode: str | None = None):
     try:
-        # Create hover text         
-        hover_text = []
-        for name, artist, album, art_pop, track_pop, url in zip(
-            df['name'], df['artist_name'], df['album_name'],
-            df['artist_popularity'], df['popularity'], df['spotify_url']
-        ):
-            hover_text.append(
-                f"Track: {name}<br>"
-                f"Artist: {artist}<br>"
-                f"Album: {album}<br>"
-                f"Artist Popularity: {art_pop}<br>"
-                f"Track Popularity: {track_pop}<br>"
-                f"<a href='{url}' target='_blank'>Open in Spotify</a>"
-            )
+        # 'svg', 'webgl' or 'binned'; chosen from the number of tracks unless given
+        if mode is None:
+            if len(df) > SCATTER_BINNED_THRESHOLD:
+                mode = 'binned'
+            elif len(df) > SCATTER_WEBGL_THRESHOLD:
+                mode = 'webgl'
+            else:
+                mode = 'svg'
 
         fig = go.Figure()
         
-        # Add scatter points
-        fig.add_trace(go.Scatter(
-            x=df['artist_popularity'],
-            y=df['popularity'],
-            name='Artists',
-            mode='markers',
-            marker=dict(
-                size=8,
-                color=df['popularity'],
-                colorscale=SEQUENTIAL_PALETTE,
-                showscale=True,
-                colorbar=dict(
-                    title=dict(
-                        text='Track<br>Popularity',
-                        side='right'
+        if mode == 'binned':
+            fig.add_trace(_binned_popularity_trace(df))
+        else:
+            # Add scatter points
+            scatter = go.Scattergl if mode == 'webgl' else go.Scatter
+            fig.add_trace(scatter(
+                x=df['artist_popularity'],
+                y=df['popularity'],
+                name='Artists',
+                mode='markers',
+                marker=dict(
+                    size=8,
+                    color=df['popularity'],
+                    colorscale=SEQUENTIAL_PALETTE,
+                    showscale=True,
+                    colorbar=dict(
+                        title=dict(
+                            text='Track<br>Popularity',
+                            side='right'
+                        ),
+                        thickness=15,
+                        len=0.7,
+                        bgcolor='rgba(0,0,0,0)'
                     ),
-                    thickness=15,
-                    len=0.7,
-                    bgcolor='rgba(0,0,0,0)'
-                ),
-                line=dict(
-                    color=SPOTIFY_COLORS['dark_gray'],
-                    width=1
+                    line=dict(
+                        color=SPOTIFY_COLORS['dark_gray'],
+                        width=1
+                    ),
+                    opacity=0.8
                 ),
-                opacity=0.8
-            ),
-            text=hover_text,
-            hovertemplate="%{text}<extra></extra>",
-            
-        ))
+                text=_track_hover_text(df),
+                hovertemplate="%{text}<extra></extra>",
+                
+            ))
         
         # Add trend line
         z = np.polyfit(df['artist_popularity'], df['popularity'], 1)
@@ -97,37 +155,40 @@ def artist_vs_track_popularity(df):
         # Apply dark theme
         apply_dark_theme(fig)
         
-        return fig.to_html(full_html=False)
+        return render_figure(fig, output)
         
     except Exception as e:
         print(f"Error in artist_vs_track_popularity: {str(e)}")
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Error loading popularity comparison",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
+        raise
+
+def _histogram_bar(values, unit):
+    # Binned here rather than by plotly.js, so the payload is 30 bars instead of every value
+    counts, edges = histogram_bins(values, bins=30)
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges) * 0.9,
+        customdata=np.column_stack([edges[:-1], edges[1:]]).round(1),
+        marker_color=SPOTIFY_COLORS['green'],
+        opacity=0.8,
+        marker_line=dict(color=SPOTIFY_COLORS['light_gray'], width=1),
+        hovertemplate=(
+            "Popularity Score: %{customdata[0]}-%{customdata[1]}<br>" +
+            f"Number of {unit}: %{{y}}<extra></extra>"
         )
-        apply_dark_theme(fig)
-        return fig.to_html(full_html=False)
+    )
 
 @cache_plot(ttl_seconds=300)
-def popularity_distribution(df):
+def popularity_distribution(df, output='fragment'):
     try:
+        artist_popularity = df['artist_popularity'].to_numpy(dtype=np.float64)
+        track_popularity = df['popularity'].to_numpy(dtype=np.float64)
+        
         artist_fig = go.Figure()
-        artist_fig.add_trace(go.Histogram(
-            x=df['artist_popularity'],
-            nbinsx=30,
-            marker_color=SPOTIFY_COLORS['green'],
-            opacity=0.8,
-            marker_line=dict(color=SPOTIFY_COLORS['light_gray'], width=1),
-            hovertemplate=(
-                "Popularity Score: %{x}<br>" +
-                "Number of Artists: %{y}<extra></extra>"
-            )
-        ))
+        artist_fig.add_trace(_histogram_bar(artist_popularity, 'Artists'))
         
         # Add mean line
-        mean_artist_pop = df['artist_popularity'].mean()
+        mean_artist_pop = np.nanmean(artist_popularity)
         artist_fig.add_vline(
             x=mean_artist_pop,
             line_dash="dash",
@@ -151,20 +212,10 @@ def popularity_distribution(df):
         # Track popularity histogram
         track_fig = go.Figure()
         
-        track_fig.add_trace(go.Histogram(
-            x=df['popularity'],
-            nbinsx=30,
-            marker_color=SPOTIFY_COLORS['green'],
-            opacity=0.8,
-            marker_line=dict(color=SPOTIFY_COLORS['light_gray'], width=1),
-            hovertemplate=(
-                "Popularity Score: %{x}<br>" +
-                "Number of Tracks: %{y}<extra></extra>"
-            )
-        ))
+        track_fig.add_trace(_histogram_bar(track_popularity, 'Tracks'))
         
         # Add mean line
-        mean_track_pop = df['popularity'].mean()
+        mean_track_pop = np.nanmean(track_popularity)
         track_fig.add_vline(
             x=mean_track_pop,
             line_dash="dash",
@@ -188,16 +239,8 @@ def popularity_distribution(df):
         
         apply_dark_theme(track_fig)
         
-        return artist_fig.to_html(full_html=False), track_fig.to_html(full_html=False)
+        return render_figure(artist_fig, output), render_figure(track_fig, output)
         
     except Exception as e:
         print(f"Error in popularity_distribution: {str(e)}")
-        error_fig = go.Figure()
-        error_fig.add_annotation(
-            text="Error loading popularity distribution",
-            showarrow=False,
-            font=dict(color=SPOTIFY_COLORS['light_gray'])
-        )
-        apply_dark_theme(error_fig)
-        error_html = error_fig.to_html(full_html=False)
-        return error_html, error_html
\ No newline at end of file
+        raise